@@ -0,0 +1,103 @@
+"""
+Throughput and tail latency of Account and Vehicle operations
+against the local mock server, at several concurrency levels.
+
+    python benchmarks/load_test.py --ops status,lock,login --concurrency 1,8,32
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from lexusenform.polling import FixedPolling  # pylint: disable=C0413
+
+import mock_server  # pylint: disable=C0413
+
+EMAIL = 'user@example.com'
+PASSWORD = 'password'
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def make_account(account_class, args):
+    config = os.path.join(tempfile.mkdtemp(), 'config.json')
+    return account_class(EMAIL, PASSWORD, config,
+                         polling=FixedPolling(args.poll_interval))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--ops', default='status,lock,refresh,login')
+    parser.add_argument('--concurrency', default='1,4,16,64')
+    parser.add_argument('--requests', type=int, default=200, help='operations per run')
+    parser.add_argument('--vehicles', type=int, default=64)
+    parser.add_argument('--latency', type=float, default=20, help='ms added to every response')
+    parser.add_argument('--jitter', type=float, default=5, help='ms of random latency jitter')
+    parser.add_argument('--handshake', type=float, default=30, help='ms per new connection')
+    parser.add_argument('--stage-seconds', type=float, default=0.2,
+                        help='seconds each command spends in each progress stage')
+    parser.add_argument('--poll-interval', type=float, default=0.1)
+    args = parser.parse_args()
+
+    stages = tuple((name, args.stage_seconds) for name, _ in mock_server.DEFAULT_STAGES)
+    vehicles = [{
+        'id': str(1000 + i),
+        'vin': 'JTHBK1GG{:03d}'.format(i),
+        'full_vin': 'JTHBK1GG{:03d}F{:05d}'.format(i, i),
+        'makeName': 'Lexus', 'modelName': 'IS 250', 'modelYear': 2015,
+    } for i in range(args.vehicles)]
+    mock, _ = mock_server.start(
+        vehicles=vehicles, stages=stages, latency=args.latency / 1000,
+        jitter=args.jitter / 1000, handshake_delay=args.handshake / 1000)
+    account_class = mock.account_class()
+
+    account = make_account(account_class, args)
+    for veh in vehicles:
+        account.add_vin_mapping(veh['id'], veh['full_vin'])
+    fleet = account.vehicles()
+
+    operations = {
+        'status': lambda i: fleet[i % len(fleet)].status(),
+        'lock': lambda i: fleet[i % len(fleet)].lock_doors(),
+        'refresh': lambda i: fleet[i % len(fleet)].status(force_refresh=True),
+        'login': lambda i: make_account(account_class, args).get_id_token(),
+    }
+
+    print('{:<8} {:>6} {:>10} {:>9} {:>9} {:>9} {:>7}'.format(
+        'op', 'conc', 'ops/s', 'p50 ms', 'p95 ms', 'p99 ms', 'errors'))
+    for op in args.ops.split(','):
+        func = operations[op]
+        for concurrency in (int(c) for c in args.concurrency.split(',')):
+            latencies = []
+            errors = [0]
+
+            def timed(i):
+                start = time.perf_counter()
+                try:
+                    func(i)
+                except Exception:  # pylint: disable=W0703
+                    errors[0] += 1
+                latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(concurrency) as pool:
+                list(pool.map(timed, range(args.requests)))
+            elapsed = time.perf_counter() - start
+            print('{:<8} {:>6} {:>10.1f} {:>9.1f} {:>9.1f} {:>9.1f} {:>7}'.format(
+                op, concurrency, args.requests / elapsed,
+                percentile(latencies, 50) * 1000, percentile(latencies, 95) * 1000,
+                percentile(latencies, 99) * 1000, errors[0]))
+    mock.stop()
+
+
+if __name__ == '__main__':
+    main()
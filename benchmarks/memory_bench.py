@@ -0,0 +1,85 @@
+"""
+Bytes held per parsed VehicleStatus and ProgressResponse,
+comparing the slotted models with the previous __dict__ models
+(and with raw response text retained, as before).
+
+    python benchmarks/memory_bench.py [count]
+"""
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from lexusenform.response_parsers import StatusParser, ProgressParser  # pylint: disable=C0413
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+PROGRESS_XML = """<SPML><RESULT><CODE>000000</CODE><VEHICLE_RESULT_CODE>01</VEHICLE_RESULT_CODE></RESULT>
+<DL><DATE>2018-06-02 14:05:11 CDT</DATE><STATUS>1</STATUS><ACTION>1</ACTION>
+<PROGRESS>NormalEnded</PROGRESS></DL><LAT>29.987877</LAT><LON>-95.548573</LON></SPML>"""
+
+
+class DictComponent:
+    """The previous, __dict__ based Component"""
+    def __init__(self, comp):
+        self.name = comp.name
+        self.closed = comp.closed
+        self.locked = comp.locked
+        self.safe = comp.safe
+
+
+class DictVehicleStatus:
+    """The previous, __dict__ based VehicleStatus"""
+    def __init__(self, status):
+        for name in status.__slots__:
+            setattr(self, name, getattr(status, name))
+        self.doors = {k: DictComponent(c) for k, c in status.doors.items()}
+        self.windows = {k: DictComponent(c) for k, c in status.windows.items()}
+        self.other = {k: DictComponent(c) for k, c in status.other.items()}
+
+
+class DictProgressResponse:
+    """The previous, __dict__ based ProgressResponse"""
+    def __init__(self, prog, text):
+        for name in prog.__slots__:
+            setattr(self, name, getattr(prog, name))
+        self.response_text = text
+
+
+def bytes_per(build, count):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    held = [build(i) for i in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del held
+    return (after - before) / count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    with open(os.path.join(FIXTURES, 'status.xml')) as f:
+        status_xml = f.read()
+
+    # each object gets its own copy of the text, as separate responses would
+    status_text = lambda i: status_xml + ' ' * (i % 2)
+    progress_text = lambda i: PROGRESS_XML + ' ' * (i % 2)
+
+    rows = [
+        ('VehicleStatus, __dict__', lambda i: DictVehicleStatus(
+            StatusParser(status_text(i)).get_object())),
+        ('VehicleStatus, slotted', lambda i: StatusParser(status_text(i)).get_object()),
+        ('ProgressResponse, __dict__ + raw', lambda i: DictProgressResponse(
+            ProgressParser(progress_text(i), 'DL').get_object(), progress_text(i))),
+        ('ProgressResponse, slotted + raw', lambda i: ProgressParser(
+            progress_text(i), 'DL', keep_raw=True).get_object()),
+        ('ProgressResponse, slotted', lambda i: ProgressParser(
+            progress_text(i), 'DL').get_object()),
+    ]
+    for name, build in rows:
+        print('{:<36} {:>8.0f} bytes'.format(name, bytes_per(build, count)))
+
+
+if __name__ == '__main__':
+    main()
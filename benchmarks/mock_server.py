@@ -0,0 +1,300 @@
+"""
+Local stand-in for the Enform services, for benchmarks and load tests.
+
+Implements the B2C login and token flow, the token exchange, the
+vehicle list and the three keyoffservices endpoints. Remote commands
+move through the progress stages on a configurable schedule, and every
+response can be delayed by a configurable latency. A fraction of
+command requests can be failed with a 503.
+"""
+import base64
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from xml.etree import ElementTree as et
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+with open(os.path.join(FIXTURES, 'status.xml'), 'rb') as _f:
+    STATUS_XML = _f.read()
+
+# Seconds spent in each progress stage before moving to the next
+DEFAULT_STAGES = (('SmsSent', 2), ('WaitingDcmRequest', 2), ('OnDcmExecuting', 2))
+NAMESPACES = ('DL', 'RES', 'REALTIMESTATUSREQUEST')
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def make_jwt(claims) -> str:
+    """Unsigned JWT with the given claims"""
+    return '.'.join((_b64(b'{"alg":"none","typ":"JWT"}'),
+                     _b64(json.dumps(claims).encode('utf-8')),
+                     _b64(b'signature')))
+
+
+class MockEnform:
+    """State shared by every request to one mock server"""
+
+    def __init__(self, users=None, vehicles=None, stages=DEFAULT_STAGES,
+                 latency: float = 0, jitter: float = 0, handshake_delay: float = 0,
+                 token_ttl: int = 3600, refresh_ttl: int = 86400, error_rate: float = 0):
+        self.users = users or {'user@example.com': 'password'}
+        self.vehicles = vehicles or [{
+            'id': str(1000 + i),
+            'vin': 'JTHBK1GG{:03d}'.format(i),
+            'full_vin': 'JTHBK1GG{:03d}F{:05d}'.format(i, i),
+            'makeName': 'Lexus',
+            'modelName': 'IS 250',
+            'modelYear': 2015,
+        } for i in range(4)]
+        self.stages = stages
+        self.latency = latency
+        self.jitter = jitter
+        self.handshake_delay = handshake_delay
+        self.token_ttl = token_ttl
+        self.refresh_ttl = refresh_ttl
+        # Fraction of keyoffservices requests answered with a 503
+        self.error_rate = error_rate
+        # Served by get_realtime_status; replace to simulate changes
+        self.status_xml = STATUS_XML
+
+        self.lock = threading.Lock()
+        self.csrf = {}        # csrf token -> transaction id
+        self.pending = {}     # transaction id -> email once the password was accepted
+        self.codes = {}       # authorization code -> email
+        self.refresh = {}     # refresh token -> email
+        self.commands = {}    # (vin, namespace) -> start time
+        self.counts = {}      # endpoint -> requests
+
+        self.server = None
+        self.base_url = None
+
+    def count(self, endpoint):
+        with self.lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(max(0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+    def tokens(self, email):
+        refresh = uuid.uuid4().hex
+        with self.lock:
+            self.refresh[refresh] = email
+        return {
+            'id_token': make_jwt({'exp': int(time.time()) + self.token_ttl, 'email': email}),
+            'id_token_expires_in': self.token_ttl,
+            'refresh_token': refresh,
+            'refresh_token_expires_in': self.refresh_ttl,
+        }
+
+    def progress(self, vin, namespace):
+        '''(stage, vehicle code) of the latest command in namespace'''
+        with self.lock:
+            started = self.commands.get((vin, namespace))
+        if started is None:
+            return 'NormalEnded', '01'
+        elapsed = time.time() - started
+        for stage, seconds in self.stages:
+            if elapsed < seconds:
+                return stage, None
+            elapsed -= seconds
+        return 'NormalEnded', '01'
+
+    def start(self, port: int = 0):
+        """Serve in a background thread. Returns the base url"""
+        handler = type('Handler', (Handler,), {
+            'enform': self, 'handshake_delay': self.handshake_delay})
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base_url = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+        return self.base_url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def account_class(self, base=None):
+        """An Account subclass with every URL pointed at this server"""
+        if base is None:
+            from lexusenform.account import Account as base  # pylint: disable=C0415
+        url = self.base_url
+        auth = url + '/b2c'
+        return type('MockAccount', (base,), {
+            'AUTHORIZATION_BASE_URL': auth,
+            'AUTHORIZATION_URL': auth + '/oauth2/v2.0/authorize',
+            'POLICY_URL_FORMAT': auth + '/{policy}/SelfAsserted',
+            'AUTH_CODE_URL_FORMAT': auth + '/{policy}/api/CombinedSigninAndSignup/confirmed',
+            'TOKEN_URL': auth + '/oauth2/v2.0/token',
+            'EXCHANGE_URL': url + '/as/exchangeToken',
+            'ACCOUNT_URL_FORMAT': url + '/m/subscription/accounts/{guid}/vehicles',
+            'COMMAND_BASE_URL': url + '/keyoffservices',
+        })
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    enform = None
+    # Seconds added to each new connection, standing in for the
+    # TCP and TLS handshake to the real server
+    handshake_delay = 0
+
+    def setup(self):
+        super().setup()
+        if self.handshake_delay:
+            time.sleep(self.handshake_delay)
+
+    def log_message(self, format, *args):  # pylint: disable=W0622
+        pass
+
+    def _reply(self, status, body=b'', content_type='application/json', headers=None):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode('utf-8')
+        elif isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or []):
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    @staticmethod
+    def _tid(query):
+        # tx=StateProperties=<base64>, sent without url-encoding
+        state = query['tx'].split('=', 1)[1].replace(' ', '+')
+        return json.loads(base64.b64decode(state))['TID']
+
+    def _form(self, body):
+        return {k: v[0] for k, v in parse_qs(body.decode('utf-8')).items()}
+
+    def _route(self, method):
+        enform = self.enform
+        parts = urlsplit(self.path)
+        query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        length = int(self.headers.get('Content-Length', 0) or 0)
+        body = self.rfile.read(length) if length else b''
+        path = parts.path
+        enform.count(path.rsplit('/', 1)[-1])
+        enform.delay()
+        if '/keyoffservices/' in path and enform.error_rate and random.random() < enform.error_rate:
+            return self._reply(503, 'Service Unavailable', 'text/plain')
+
+        if path.endswith('/oauth2/v2.0/authorize'):
+            csrf, tid = uuid.uuid4().hex, uuid.uuid4().hex
+            with enform.lock:
+                enform.csrf[csrf] = tid
+            trans = base64.b64encode(json.dumps({'T_DIC': [{'I': tid}]}).encode('utf-8'))
+            return self._reply(200, '<html></html>', 'text/html', headers=[
+                ('Set-Cookie', 'x-ms-cpim-csrf={}; path=/'.format(csrf)),
+                ('Set-Cookie', 'x-ms-cpim-trans={}; path=/'.format(trans.decode('ascii')))])
+
+        if path.endswith('/SelfAsserted'):
+            form = self._form(body)
+            tid = self._tid(query)
+            if enform.users.get(form.get('logonIdentifier')) == form.get('password'):
+                with enform.lock:
+                    enform.pending[tid] = form['logonIdentifier']
+                return self._reply(200, {'status': '200'})
+            return self._reply(200, {'status': '400', 'message': 'Invalid credentials'})
+
+        if path.endswith('/api/CombinedSigninAndSignup/confirmed'):
+            tid = self._tid(query)
+            with enform.lock:
+                email = enform.pending.pop(tid, None)
+                code = uuid.uuid4().hex
+                if email is not None:
+                    enform.codes[code] = email
+            location = 'urn:ietf:wg:oauth:2.0:oob?' + (
+                'code=' + code if email is not None else 'error=access_denied')
+            return self._reply(302, headers=[('Location', location)])
+
+        if path.endswith('/oauth2/v2.0/token'):
+            form = self._form(body)
+            with enform.lock:
+                if form.get('grant_type') == 'authorization_code':
+                    email = enform.codes.pop(form.get('code'), None)
+                else:
+                    email = enform.refresh.get(form.get('refresh_token'))
+            if email is None:
+                return self._reply(400, {'error': 'invalid_grant',
+                                         'error_description': 'Unknown code or token'})
+            return self._reply(200, enform.tokens(email))
+
+        if path.endswith('/as/exchangeToken'):
+            return self._reply(200, {'access_token': uuid.uuid4().hex}, headers=[
+                ('CV-APIKey', 'mock-api-key'), ('GUID', 'mock-guid')])
+
+        if path.endswith('/vehicles'):
+            return self._reply(200, [{k: v for k, v in veh.items() if k != 'full_vin'}
+                                     for veh in enform.vehicles])
+
+        if path.endswith('/remote_control.aspx'):
+            root = et.fromstring(body)
+            vin = root.findtext('COMMON/USER/USER_ID')
+            for namespace in NAMESPACES:
+                if root.find(namespace) is not None:
+                    with enform.lock:
+                        enform.commands[(vin, namespace)] = time.time()
+            return self._reply(200, '<SPML><RESULT><CODE>011000</CODE>'
+                               '<DATETIME>{}</DATETIME></RESULT></SPML>'.format(
+                                   time.strftime('%Y-%m-%d %H:%M:%S CDT')), 'text/xml')
+
+        if path.endswith('/get_remote_control_status_and_latest_info.aspx'):
+            root = et.fromstring(body)
+            vin = root.findtext('COMMON/USER/USER_ID')
+            namespace = root.findtext('COMMAND')
+            stage, vehicle_code = enform.progress(vin, namespace)
+            return self._reply(200, (
+                '<SPML><RESULT><CODE>000000</CODE>{code}</RESULT>'
+                '<{ns}><DATE>{date}</DATE><STATUS>1</STATUS><ACTION>1</ACTION>'
+                '<PROGRESS>{stage}</PROGRESS></{ns}>'
+                '<LAT>29.987877</LAT><LON>-95.548573</LON></SPML>').format(
+                    code='<VEHICLE_RESULT_CODE>{}</VEHICLE_RESULT_CODE>'.format(vehicle_code)
+                    if vehicle_code else '',
+                    ns=namespace, stage=stage,
+                    date=time.strftime('%Y-%m-%d %H:%M:%S CDT')), 'text/xml')
+
+        if path.endswith('/get_realtime_status.aspx'):
+            return self._reply(200, enform.status_xml, 'text/xml')
+
+        return self._reply(404, {'error': 'not found'})
+
+    def do_GET(self):  # pylint: disable=C0103
+        self._route('GET')
+
+    def do_POST(self):  # pylint: disable=C0103
+        self._route('POST')
+
+    def do_HEAD(self):  # pylint: disable=C0103
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+def start(port: int = 0, **kwargs):
+    """Start a MockEnform in a background thread. Returns (mock, base_url)"""
+    mock = MockEnform(**kwargs)
+    return mock, mock.start(port)
+
+
+if __name__ == '__main__':
+    MOCK, URL = start(8080)
+    print('Listening on {}'.format(URL))
+    try:
+        while MOCK.thread.is_alive():
+            MOCK.thread.join(0.5)
+    except KeyboardInterrupt:
+        MOCK.stop()
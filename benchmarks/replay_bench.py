@@ -0,0 +1,53 @@
+"""
+Microseconds per parse for every response in a TrafficArchive,
+grouped by endpoint, so the response parsers can be measured on
+recorded traffic instead of the fixtures.
+
+    python benchmarks/replay_bench.py archive [iterations]
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from lexusenform import response_parsers as rp  # pylint: disable=C0413
+from lexusenform.recording import TrafficArchive, record_text  # pylint: disable=C0413
+
+PARSERS = {
+    '/get_realtime_status.aspx': rp.StatusParser,
+    '/get_remote_control_status_and_latest_info.aspx': rp.ProgressParser,
+    '/remote_control.aspx': rp.BasicCommandResponseParser,
+}
+# The namespace a command response is parsed in, from its request body
+NAMESPACE = re.compile(r'<COMMAND>(\w+)</COMMAND>|</COMMON><(\w+)>')
+
+
+def namespace(body):
+    match = NAMESPACE.search(body)
+    return match and (match.group(1) or match.group(2))
+
+
+def main():
+    archive = TrafficArchive(sys.argv[1])
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    corpus = {}
+    for record in archive.records():
+        for suffix, parser in PARSERS.items():
+            if record['path'].endswith(suffix) and record['status'] == 200:
+                corpus.setdefault(suffix, (parser, []))[1].append(
+                    (record_text(record), namespace(record_text(record, 'body'))))
+    archive.close()
+
+    for suffix, (parser, texts) in sorted(corpus.items()):
+        def parse_all(parser=parser, texts=texts):
+            for text, ns in texts:
+                parser(text, ns).get_object()
+        seconds = min(timeit.repeat(parse_all, number=iterations, repeat=3))
+        print('{:<50} {:>6} responses {:>8.1f} us/parse'.format(
+            suffix, len(texts), seconds / iterations / len(texts) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
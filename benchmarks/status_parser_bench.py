@@ -0,0 +1,175 @@
+"""
+Compare StatusParser with the previous if/elif parser on the
+recorded fixtures: confirm identical VehicleStatus output and
+report microseconds per parse.
+
+    python benchmarks/status_parser_bench.py [iterations]
+"""
+import glob
+import os
+import sys
+import timeit
+
+import dateutil.parser as dp
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from lexusenform import models  # pylint: disable=C0413
+from lexusenform.response_parsers import ResponseParser, StatusParser  # pylint: disable=C0413
+from lexusenform.timezone import TIMEZONE_MAPPING  # pylint: disable=C0413
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+class LegacyStatusParser(ResponseParser):
+    """The if/elif StatusParser this benchmark compares against"""
+
+    def get_object(self):
+        date = dp.parse(self.root.find("DATETIME").text, tzinfos=TIMEZONE_MAPPING)
+        dash = dp.parse(self.root.find("DASHBOARD_DATETIME").text, tzinfos=TIMEZONE_MAPPING)
+
+        odometer = None
+        fuel_gague = None
+        drive_range = None
+        trip_a = None
+        trip_b = None
+        hazards_on = False
+
+        doors = {
+            'driver': models.Component("Driver Door"),
+            'passenger': models.Component("Passenger Door"),
+            'rear_passenger': models.Component("Rear Passenger Door"),
+            'rear_driver': models.Component("Rear Driver Door")
+        }
+        windows = {
+            'driver': models.Component("Driver Window"),
+            'passenger': models.Component("Passenger Window"),
+            'rear_passenger': models.Component("Rear Passenger Window"),
+            'rear_driver': models.Component("Rear Driver Window")
+        }
+        other = {
+            'hood': models.Component("Hood"),
+            'trunk': models.Component("Trunk"),
+            'sunroof': models.Component("Sunroof")
+        }
+
+        for item in self.root.findall('LIST/ITEM'):
+            typ = item.find('TYPE')
+            if typ is not None:
+                typ = typ.text
+            data = item.find('DATA')
+            if data is not None:
+                data = data.text
+            unit = item.find('UNIT')
+            if unit is not None:
+                unit = unit.text
+            safe = item.find('SECURITY')
+            if safe is not None:
+                safe = safe.text
+
+            if typ == 'ODO':
+                odometer = (float(data), unit)
+            elif typ == 'FUGAGE':
+                fuel_gague = (float(data), unit)
+            elif typ == 'RAGE':
+                drive_range = (float(data), unit)
+            elif typ == 'TRIPA':
+                trip_a = (float(data), unit)
+            elif typ == 'TRIPB':
+                trip_b = (float(data), unit)
+
+            elif typ == 'DCTY':
+                doors['driver'].closed = data == 'close'
+                doors['driver'].safe = doors['driver'].safe and (safe == 'safe')
+            elif typ == 'RLCY':
+                doors['rear_driver'].closed = data == 'close'
+                doors['rear_driver'].safe = doors['rear_driver'].safe and (safe == 'safe')
+            elif typ == 'PCTY':
+                doors['passenger'].closed = data == 'close'
+                doors['passenger'].safe = doors['passenger'].safe and (safe == 'safe')
+            elif typ == 'RRCY':
+                doors['rear_passenger'].closed = data == 'close'
+                doors['rear_passenger'].safe = doors['rear_passenger'].safe and (safe == 'safe')
+            elif typ == 'HDCY':
+                other['hood'].closed = data == 'close'
+                other['hood'].safe = other['hood'].safe and (safe == 'safe')
+            elif typ == 'LGCY':
+                other['trunk'].closed = data == 'close'
+                other['trunk'].safe = other['trunk'].safe and (safe == 'safe')
+            elif typ == 'SRPOS':
+                other['sunroof'].closed = data == 'close'
+                other['sunroof'].safe = other['sunroof'].safe and (safe == 'safe')
+
+            elif typ == 'LSWD':
+                doors['driver'].locked = data == 'lock'
+                doors['driver'].safe = doors['driver'].safe and (safe == 'safe')
+            elif typ == 'LSWP':
+                doors['passenger'].locked = data == 'lock'
+                doors['passenger'].safe = doors['passenger'].safe and (safe == 'safe')
+            elif typ == 'LSWR':
+                doors['rear_passenger'].locked = data == 'lock'
+                doors['rear_passenger'].safe = doors['rear_passenger'].safe and (safe == 'safe')
+            elif typ == 'LSWL':
+                doors['rear_driver'].locked = data == 'lock'
+                doors['rear_driver'].safe = doors['rear_driver'].safe and (safe == 'safe')
+
+            elif typ == 'PWDRD':
+                windows['driver'].closed = data == 'close'
+                windows['driver'].safe = windows['driver'].safe and (safe == 'safe')
+            elif typ == 'PWDRL':
+                windows['rear_driver'].closed = data == 'close'
+                windows['rear_driver'].safe = windows['driver'].safe and (safe == 'safe')
+            elif typ == 'PWDRP':
+                windows['passenger'].closed = data == 'close'
+                windows['passenger'].safe = windows['driver'].safe and (safe == 'safe')
+            elif typ == 'PWDRR':
+                windows['rear_passenger'].closed = data == 'close'
+                windows['rear_passenger'].safe = windows['driver'].safe and (safe == 'safe')
+
+            elif typ == 'HAZB':
+                hazards_on = data != 'off'
+
+        return models.VehicleStatus(
+            date,
+            dash,
+            odometer,
+            fuel_gague,
+            drive_range,
+            trip_a,
+            trip_b,
+            hazards_on,
+            doors,
+            windows,
+            other)
+
+
+def as_tuple(status):
+    """Everything in a VehicleStatus, for comparison"""
+    def comps(group):
+        return [(k, c.name, c.closed, c.locked, c.safe) for k, c in group.items()]
+    return (status.last_updated_date, status.dashboard_date, status.odometer,
+            status.fuel_gauge, status.drive_range, status.trip_a, status.trip_b,
+            status.hazards_on, comps(status.doors), comps(status.windows),
+            comps(status.other))
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print('{:<24} {:>10} {:>10}'.format('fixture', 'legacy us', 'table us'))
+    for path in sorted(glob.glob(os.path.join(FIXTURES, 'status*.xml'))):
+        with open(path) as f:
+            text = f.read()
+        old = LegacyStatusParser(text).get_object()
+        new = StatusParser(text).get_object()
+        assert as_tuple(old) == as_tuple(new), path
+
+        old_us = timeit.timeit(lambda: LegacyStatusParser(text).get_object(),
+                               number=iterations) / iterations * 1e6
+        new_us = timeit.timeit(lambda: StatusParser(text).get_object(),
+                               number=iterations) / iterations * 1e6
+        print('{:<24} {:>10.2f} {:>10.2f}'.format(os.path.basename(path), old_us, new_us))
+    print('VehicleStatus output identical for every fixture')
+
+
+if __name__ == '__main__':
+    main()
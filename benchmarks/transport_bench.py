@@ -0,0 +1,61 @@
+"""
+Requests/second for Account.execute with and without
+a pooled transport, against the local mock server.
+
+    python benchmarks/transport_bench.py [requests] [threads] [handshake_ms]
+
+The mock server delays every new connection by handshake_ms to
+stand in for the TCP and TLS setup cost of the real host.
+"""
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from lexusenform.account import Account  # pylint: disable=C0413
+from lexusenform.commands import Commands  # pylint: disable=C0413
+from lexusenform.transport import Transport, SessionTransport  # pylint: disable=C0413
+
+import mock_server  # pylint: disable=C0413
+
+
+class UnpooledTransport(Transport):
+    """The previous behaviour: a new connection for every request"""
+
+    def request(self, method, url, session=None, **kwargs):
+        if session is not None:
+            return session.request(method, url, **kwargs)
+        return requests.request(method, url, **kwargs)
+
+
+def run(account, total, threads):
+    cmd = Commands.vehicle_status('token', 'JTHBK1GG0F0000000')
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(lambda _: account.execute(cmd), range(total)))
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    handshake = float(sys.argv[3]) if len(sys.argv) > 3 else 30
+    mock, _ = mock_server.start(handshake_delay=handshake / 1000)
+    config = os.path.join(tempfile.mkdtemp(), 'config.json')
+    BenchAccount = mock.account_class(Account)  # pylint: disable=C0103
+
+    for name, transport in (('unpooled', UnpooledTransport()),
+                            ('pooled', SessionTransport(pool_maxsize=threads))):
+        account = BenchAccount('bench@example.com', 'password', config, transport=transport)
+        rate = run(account, total, threads)
+        print('{:<10} {:>10.1f} req/s'.format(name, rate))
+    mock.stop()
+
+
+if __name__ == '__main__':
+    main()
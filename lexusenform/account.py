@@ -2,17 +2,32 @@
 import base64
 import json
 import time
-from typing import List
+from typing import Iterable, Iterator, List
 from urllib.parse import urlsplit, parse_qs
 
 import requests
 
-from .commands import Command
-from . import jwt
 from . import AccountError
+from . import deadline
+from . import jwt
+from . import response_parsers as rp
+from .cache_store import CacheStore, JsonCacheStore
+from .commands import Command, Commands
+from .deadline import DeadlineExceeded
+from .fleet import BatchExecutor, BatchResult, Fleet
+from .history import StatusHistory
+from .instrumentation import Hooks, Instrumentation
+from .poller import ProgressPoller
+from .polling import PollingStrategy, AdaptivePolling
+from .registry import VehicleRegistry
+from .retry import CircuitBreakers, RetryPolicy
+from .scheduler import CommandScheduler
+from .snapshot import FleetSnapshot
+from .status_cache import StatusCache
+from .tokens import TokenManager
+from .transport import Transport, SessionTransport
 from .vehicle import Vehicle, VehicleEncoder, VehicleDecoder
 
-
 def pretty_print(req):
     """
     At this point it is completely built and ready
@@ -54,6 +69,8 @@ class Account:
     CACHE_REFRESH_KEY = 'refresh_token'
     CACHE_REFRESH_EXPIRES = 'refresh_expires'
 
+    TOKEN_KEYS = (CACHE_ID_KEY, CACHE_ID_EXPIRES, CACHE_REFRESH_KEY, CACHE_REFRESH_EXPIRES)
+
     EXPIRE_SECONDS_BUFFER = 15
 
 
@@ -63,46 +80,139 @@ class Account:
     SCOPE = "profile offline_access openid"
 
     DEBUG = False
-
-    def __init__(self, email: str, password: str, config_file: str = None):
+    # Keep the raw XML on parsed responses. Always on with DEBUG.
+    KEEP_RAW_RESPONSES = False
+
+    def __init__(self, email: str, password: str, config_file: str = None,
+                 transport: Transport = None, polling: PollingStrategy = None,
+                 coalesce_polls: bool = True, cache_store: CacheStore = None,
+                 history: StatusHistory = None, status_cache: StatusCache = None,
+                 retry: RetryPolicy = None, circuit_breakers: CircuitBreakers = None,
+                 scheduler: CommandScheduler = None):
         self.email = email
         self.password = password
         self.config_file = config_file
+        self.transport = transport or SessionTransport()
+        if polling is None:
+            # keep learned stage durations across restarts, next to the config file
+            polling = AdaptivePolling(config_file + '.polling' if config_file else None)
+        self.polling = polling
+        self.poller = ProgressPoller(self) if coalesce_polls else None
+        self.history = history
+        self.status_cache = status_cache
+        self.instrumentation = Instrumentation()
+        self.retry = retry or RetryPolicy()
+        self.breakers = circuit_breakers or CircuitBreakers()
+        self.scheduler = scheduler
+
+        if cache_store is None:
+            if config_file is not None:
+                cache_store = JsonCacheStore(config_file)
+            else:
+                cache_store = CacheStore()
+        cache_store.encoder = VehicleEncoder
+        cache_store.decoder = VehicleDecoder
+        self._store = cache_store
 
         self._token_cache = self._load_from_config() or {}
+        self.registry = VehicleRegistry(self._token_cache.get('vehicles', ()))
+        for veh in self.registry:
+            veh.set_account(self)
         if 'vehicles' in self._token_cache:
-            for veh in self._token_cache['vehicles']:
-                veh.set_account(self)
-        self._disable_config_file = False
+            # the registry owns the list that is persisted
+            self._token_cache['vehicles'] = self.registry.vehicles
+            self.registry.apply_mappings(self._token_cache.get('mappings', {}))
+        self.tokens = TokenManager(self)
 
 
     def _load_from_config(self):
+        return self._store.load()
+
+    def _save_cache(self, *keys, flush: bool = False):
+        '''
+        Persist the given cache keys, or the whole cache if none
+        are given. Writes may be batched unless flush is set.
+        '''
+        return self._store.save(self._token_cache, keys or None, flush=flush)
+
+    def _send(self, method: str, url: str, **kwargs):
+        '''
+        Send a request through the transport, unless the host's
+        circuit is open, reporting it to any hooks
+        '''
+        parts = urlsplit(url)
+        limit = deadline.current()
+        if limit is not None:
+            limit.check('Request to {}'.format(parts.path.rsplit('/', 1)[-1]))
+            kwargs['timeout'] = limit.timeout(kwargs.get('timeout'))
+        breaker = self.breakers.get(parts.netloc)
+        breaker.before_request()
+        instrumentation = self.instrumentation
+        start = time.perf_counter() if instrumentation.hooks else None
+        resp = None
+        cut_short = False
         try:
-            with open(self.config_file, 'r') as f:
-                return json.load(f, cls=VehicleDecoder)
-        except IOError:
-            return None
-
-    def _save_cache(self):
-        if not self._disable_config_file:  # when it is not accessible, skip
-            try:
-                with open(self.config_file, 'w') as f:
-                    json.dump(self._token_cache, f, sort_keys=True, indent=4, cls=VehicleEncoder)
-                    return True
-            except IOError:
-                self._disable_config_file = True
-                return False
+            resp = self.transport.request(method, url, **kwargs)
+            return resp
+        except requests.Timeout as ex:
+            if limit is None or limit.remaining() > 0:
+                raise
+            # our deadline, not the host, ended the request
+            cut_short = True
+            raise DeadlineExceeded('Request to {} timed out'.format(
+                parts.path.rsplit('/', 1)[-1]), limit.remaining()) from ex
+        finally:
+            if cut_short:
+                breaker.release()
+            else:
+                breaker.record(resp is not None and resp.status_code < 500)
+            if start is not None:
+                sent = 0
+                if resp is not None and resp.request is not None and resp.request.body:
+                    sent = len(resp.request.body)
+                instrumentation.request(
+                    parts.netloc, parts.path.rsplit('/', 1)[-1], method,
+                    resp.status_code if resp is not None else None,
+                    time.perf_counter() - start, sent,
+                    len(resp.content) if resp is not None else 0)
+
+    def warm_up(self):
+        '''
+        Resolve and connect to every host the account talks to,
+        so the first command does not pay for DNS and TLS setup.
+        '''
+        return self.transport.warm_up([
+            self.AUTHORIZATION_BASE_URL,
+            self.EXCHANGE_URL,
+            self.ACCOUNT_URL_FORMAT,
+            self.COMMAND_BASE_URL
+        ])
+
+    def add_hook(self, hook: Hooks):
+        """Attach instrumentation hooks, such as a Metrics instance"""
+        self.instrumentation.add(hook)
 
     def get_id_token(self):
+        return self.tokens.get()
+
+    def _renew_tokens(self, seen: str = None):
+        '''
+        Get a new id token, using the refresh token when it is
+        still valid and logging in again otherwise. seen is the
+        token the caller wants replaced; a different, valid one
+        in the store means another process already renewed it.
+        '''
         cache = self._token_cache
-        if cache and self.CACHE_ID_KEY in cache:
-            tok = cache[self.CACHE_ID_KEY]
-            if jwt.token_is_expired(tok):
-                toks = self._refresh_id_token()
-                return toks[self.CACHE_ID_KEY]
-            return tok
-        toks = self._request_new_tokens()
-        return toks[self.CACHE_ID_KEY]
+        with self._store.lock():
+            cache.update(self._store.reload(self.TOKEN_KEYS))
+            tok = cache.get(self.CACHE_ID_KEY)
+            if (tok and tok != seen and
+                    jwt.token_expiry(tok) - self.EXPIRE_SECONDS_BUFFER > time.time()):
+                return
+            if cache and self.CACHE_REFRESH_KEY in cache:
+                self._refresh_id_token()
+            else:
+                self._request_new_tokens()
 
     def _refresh_id_token(self):
         cache = self._token_cache
@@ -112,7 +222,7 @@ class Account:
             if time.time() > expire_time:  # refresh token expired
                 toks = self._request_new_tokens()
                 return toks[self.CACHE_ID_KEY]
-            tok = requests.post(self.TOKEN_URL,
+            tok = self._send('POST', self.TOKEN_URL,
                 params={
                     "p": self.ENFORM_POLICY
                 },
@@ -126,6 +236,9 @@ class Account:
                 })
 
             resp = tok.json()
+            if resp.get("error") == "invalid_grant":
+                # refresh token revoked or rotated away; log in again
+                return self._request_new_tokens()
             if "error" in resp:
                 if "error_description" in resp:
                     raise AccountError("Refresh failure: {}".format(
@@ -137,15 +250,26 @@ class Account:
 
             cache[self.CACHE_ID_KEY] = resp[self.CACHE_ID_KEY]
             cache[self.CACHE_ID_EXPIRES] = resp['id_token_expires_in'] + int(time.time())
-            self._save_cache()
+            keys = (self.CACHE_ID_KEY, self.CACHE_ID_EXPIRES)
+            if self.CACHE_REFRESH_KEY in resp:
+                # B2C rotates refresh tokens; keeping the new one
+                # slides the session forward instead of logging in again
+                cache[self.CACHE_REFRESH_KEY] = resp[self.CACHE_REFRESH_KEY]
+                cache[self.CACHE_REFRESH_EXPIRES] = (resp['refresh_token_expires_in']
+                                                     + int(time.time())
+                                                     - self.EXPIRE_SECONDS_BUFFER)
+                keys = self.TOKEN_KEYS
+            if self.instrumentation.hooks:
+                self.instrumentation.token('refresh')
+            self._save_cache(*keys, flush=True)
 
             return resp
 
 
     def _request_new_tokens(self):
-        sess = requests.Session()
+        sess = self.transport.new_session()
 
-        auth = sess.get(self.AUTHORIZATION_URL,
+        auth = self._send('GET', self.AUTHORIZATION_URL, session=sess,
             params={
                 "client_id": self.CLIENT_ID,
                 "response_type": "code",
@@ -163,8 +287,9 @@ class Account:
         tid = base64.b64encode(bytes('{"TID":"' + tid + '"}', 'utf-8')).decode("utf-8")
 
         # send policy login request. For some reason, the response is never used
-        sess.post((self.POLICY_URL_FORMAT + self.POLICY_QUERY_FORMAT)
+        self._send('POST', (self.POLICY_URL_FORMAT + self.POLICY_QUERY_FORMAT)
                 .format(tid=tid, policy=self.ENFORM_POLICY),
+            session=sess,
             data={
                 "request_type": "RESPONSE",
                 "logonIdentifier": self.email,
@@ -176,11 +301,12 @@ class Account:
             })
 
 
-        code_req = sess.get((self.AUTH_CODE_URL_FORMAT + self.AUTH_CODE_QUERY_FORMAT)
+        code_req = self._send('GET', (self.AUTH_CODE_URL_FORMAT + self.AUTH_CODE_QUERY_FORMAT)
             .format(
                 policy=self.ENFORM_POLICY,
                 csrf=csrf,
                 tid=tid),
+            session=sess,
             allow_redirects=False)
 
         urn = code_req.headers["Location"]
@@ -190,7 +316,7 @@ class Account:
         query = parse_qs(urlsplit(urn).query)
         auth_code = query['code'][0]
 
-        tok_req = sess.post(self.TOKEN_URL,
+        tok_req = self._send('POST', self.TOKEN_URL, session=sess,
             params={
                 'p': self.ENFORM_POLICY
             },
@@ -207,6 +333,9 @@ class Account:
         if not self.CACHE_ID_KEY in toks:
             raise AccountError("Refresh failure: {}".format(tok_req.text))
 
+        if self.instrumentation.hooks:
+            self.instrumentation.token('login')
+
         cache = self._token_cache
         cache[self.CACHE_ID_KEY] = toks[self.CACHE_ID_KEY]
         cache[self.CACHE_ID_EXPIRES] = (toks['id_token_expires_in'] + int(time.time())
@@ -214,7 +343,7 @@ class Account:
         cache[self.CACHE_REFRESH_KEY] = toks[self.CACHE_REFRESH_KEY]
         cache[self.CACHE_REFRESH_EXPIRES] = (toks['refresh_token_expires_in'] + int(time.time())
                                              - self.EXPIRE_SECONDS_BUFFER)
-        self._save_cache()
+        self._save_cache(*self.TOKEN_KEYS, flush=True)
         return toks
 
 
@@ -227,28 +356,92 @@ class Account:
             cache['mappings'] = {}
         cache['mappings'][vehicle_id] = vin
 
-        vehicles = cache.get('vehicles')
-        if vehicles:
-            for v in vehicles:
-                if v.vehicle_id == vehicle_id:
-                    v.full_vin = vin
-
-        self._save_cache()
+        veh = self.registry.get(vehicle_id)
+        if veh is not None:
+            self.registry.set_full_vin(veh, vin)
+            self._save_cache('mappings', 'vehicles')
+        else:
+            self._save_cache('mappings')
 
     def execute(self, command: Command):
-        """Execute a command"""
-        req = requests.post('{}{}'.format(self.COMMAND_BASE_URL, command.path),
-            params=command.query,
-            headers=command.headers,
-            data=command.body)
-        if self.DEBUG is True:
-            print(pretty_print(req.request))
+        '''
+        Execute a command, retrying transient failures as
+        allowed by the retry policy
+        '''
+        attempt = 1
+        while True:
+            if self.scheduler is not None:
+                self._schedule(command)
+            try:
+                req = self._send('POST', '{}{}'.format(self.COMMAND_BASE_URL, command.path),
+                    params=command.query,
+                    headers=command.headers,
+                    data=command.body)
+            except requests.RequestException as ex:
+                if not self.retry.retry_error(command, ex, attempt):
+                    raise
+                reason = type(ex).__name__
+            else:
+                if self.DEBUG is True:
+                    print(pretty_print(req.request))
+
+                if req.status_code == 200:
+                    parser = command.response_parser(req.text, command.namespace,
+                                                      keep_raw=self.DEBUG or self.KEEP_RAW_RESPONSES)
+                    result = parser.get_object()
+                    if not self.retry.retry_result(command, result, attempt):
+                        return result
+                    reason = 'progress {}'.format(result.progress)
+                elif self.retry.retry_status(command, req.status_code, attempt):
+                    reason = 'status {}'.format(req.status_code)
+                else:
+                    raise AccountError("Command failed: {}".format(req.text))
+
+            if self.instrumentation.hooks:
+                self.instrumentation.retry(command.path.rsplit('/', 1)[-1], attempt, reason)
+            deadline.sleep(self.retry.delay(attempt), 'Retry of {}'.format(command.path))
+            attempt += 1
+
+    def _schedule(self, command: Command):
+        '''Wait for the scheduler to let a command through'''
+        scheduler = self.scheduler
+        waited = scheduler.acquire(command, self.email)
+        if self.instrumentation.hooks:
+            priority = scheduler.priority(command)
+            self.instrumentation.schedule(scheduler.PRIORITIES[priority], waited,
+                                          scheduler.depth(priority))
+
+    def execute_many(self, commands: Iterable[Command],
+                     max_workers: int = None) -> Iterator[BatchResult]:
+        '''
+        Execute many commands concurrently, yielding a BatchResult
+        for each command as soon as it completes
+        '''
+        return BatchExecutor(max_workers).as_completed(commands, self.execute)
+
+    def fleet(self, max_workers: int = None, force_refresh: bool = False) -> Fleet:
+        """Every vehicle on the account, for running batch operations"""
+        return Fleet(self.vehicles(force_refresh), max_workers)
+
+    def status_all(self, max_workers: int = None) -> FleetSnapshot:
+        '''
+        Fetch the status of every vehicle concurrently, parsed
+        straight into the columns of a FleetSnapshot
+        '''
+        vehicles = self.vehicles()
+        snapshot = FleetSnapshot([v.full_vin or v.partial_vin for v in vehicles])
+        tok = self.get_id_token()
 
-        if not req.status_code == 200:
-            raise AccountError("Command failed: {}".format(req.text))
+        def fetch(veh):
+            veh.ensure_vin()
+            return self.execute(Commands.vehicle_status(tok, veh.full_vin, rp.StatusRowParser))
 
-        parser = command.response_parser(req.text, command.namespace)
-        return parser.get_object()
+        for idx, res in enumerate(BatchExecutor(max_workers).run(vehicles, fetch)):
+            if res.ok:
+                snapshot.set_row(idx, *res.value)
+            else:
+                snapshot.set_error(idx, res.error)
+        return snapshot
 
     def vehicles(self, force_refresh: bool = False) -> List[Vehicle]:
         """Retrieve the list of vehicles from the account"""
@@ -256,18 +449,10 @@ class Account:
         cache = self._token_cache
 
         if not force_refresh and 'vehicles' in cache:
-            veh = cache['vehicles']
-            updated = False
-            for v in veh:
-                if v.full_vin is None:
-                    full_vin = cache.get("mappings", {}).get(v.vehicle_id, None)
-                    v.full_vin = full_vin
-            if updated:
-                self._save_cache()
-            return veh
+            return self.registry.vehicles
 
         tok = self.get_id_token()
-        exch = requests.post(self.EXCHANGE_URL,
+        exch = self._send('POST', self.EXCHANGE_URL,
             headers={
                 'CV-TSP': 'LEXUS_17CY',  # 16CY and 18CY don't work... yet?
                 'CV-OS-VERSION': '7.0',
@@ -282,7 +467,7 @@ class Account:
         apikey = exch.headers['CV-APIKey']
         guid = exch.headers['GUID']
 
-        veh_req = requests.get(self.ACCOUNT_URL_FORMAT.format(guid=guid),
+        veh_req = self._send('GET', self.ACCOUNT_URL_FORMAT.format(guid=guid),
             params={
                 "view": "SUMMARY",
                 "role": "REMOTECMD_USER",
@@ -298,24 +483,13 @@ class Account:
         if not veh_req.status_code == 200:
             raise AccountError("Invalid response from account: {}".format(veh_req.text))
 
-        ret = []
-        for item in veh_req.json():
-            full_vin = cache.get("mappings", {}).get(item['id'], None)
-            print(cache)
-            veh = Vehicle(item['id'], item['vin'], full_vin,
-                item['makeName'], item['modelName'], item['modelYear'],
-                extra_data=item)
-            veh.set_account(self)
-            ret.append(veh)
-
-        cache['vehicles'] = ret
-        self._save_cache()
-        return ret
+        changed = self.registry.update(veh_req.json(), cache.get('mappings', {}), self)
+        if changed or 'vehicles' not in cache:
+            cache['vehicles'] = self.registry.vehicles
+            self._save_cache('vehicles')
+        return self.registry.vehicles
 
     def vehicle(self, vin: str, force_refresh: bool = False) -> Vehicle:
-        """Find a vehicle by its VIN"""
-        veh = self.vehicles(force_refresh)
-        for v in veh:
-            if vin == v.full_vin or vin.startswith(v.partial_vin):
-                return v
-        return None
+        """Find a vehicle by its full VIN, or a VIN starting with its partial VIN"""
+        self.vehicles(force_refresh)
+        return self.registry.find(vin)
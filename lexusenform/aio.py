@@ -0,0 +1,229 @@
+"""asyncio interface to the Lexus Enform service"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+from datetime import timedelta
+import functools
+import time
+from typing import AsyncIterator, List
+
+from .account import Account
+from .commands import Command, Commands as c
+from .models import PlanResult
+from .polling import FixedPolling, ProgressTracker
+from .vehicle import Vehicle, progress_finished, print_progress
+from .watch import Change, WatchCadence, diff_status
+from . import AccountError
+from . import deadline
+
+
+class AsyncAccount:
+    '''
+    Asynchronous wrapper around an Account. Tokens, the config
+    cache and the response parsers are shared with the sync API.
+    HTTP requests run on a small bounded thread pool; waiting on
+    command progress never holds a thread.
+    '''
+    MAX_WORKERS = 32
+
+    def __init__(self, email: str = None, password: str = None, config_file: str = None,
+                 transport=None, account: Account = None, max_workers: int = None):
+        self.account = account or Account(email, password, config_file, transport=transport)
+        self._executor = ThreadPoolExecutor(max_workers or self.MAX_WORKERS)
+
+    @property
+    def DEBUG(self):  # pylint: disable=C0103
+        return self.account.DEBUG
+
+    @property
+    def polling(self):
+        return self.account.polling
+
+    @property
+    def instrumentation(self):
+        return self.account.instrumentation
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        # carry the task's deadline over to the worker thread
+        return await loop.run_in_executor(
+            self._executor, functools.partial(contextvars.copy_context().run,
+                                              func, *args, **kwargs))
+
+    async def get_id_token(self):
+        """Retrieve a valid id token, refreshing it if required"""
+        return await self._run(self.account.get_id_token)
+
+    async def execute(self, command: Command):
+        """Execute a command"""
+        return await self._run(self.account.execute, command)
+
+    async def add_vin_mapping(self, vehicle_id, vin):
+        """Record the full VIN for a vehicle"""
+        await self._run(self.account.add_vin_mapping, vehicle_id, vin)
+
+    async def vehicles(self, force_refresh: bool = False) -> List['AsyncVehicle']:
+        """Retrieve the list of vehicles from the account"""
+        veh = await self._run(self.account.vehicles, force_refresh)
+        return [AsyncVehicle(v, self) for v in veh]
+
+    async def vehicle(self, vin: str, force_refresh: bool = False) -> 'AsyncVehicle':
+        """Find a vehicle by its VIN"""
+        veh = await self._run(self.account.vehicle, vin, force_refresh)
+        if veh is None:
+            return None
+        return AsyncVehicle(veh, self)
+
+    def close(self):
+        """Shut down the worker threads"""
+        self._executor.shutdown(wait=False)
+
+
+class AsyncVehicle:
+    """Asynchronous counterpart to Vehicle"""
+
+    def __init__(self, vehicle: Vehicle, account: AsyncAccount):
+        self.vehicle = vehicle
+        self._account = account
+
+    def __getattr__(self, name):
+        return getattr(self.vehicle, name)
+
+    async def _process_until_finished(self,
+                                      namespace: str,
+                                      vehicle_code: str = None,
+                                      sleep: timedelta = None,
+                                      timeout: timedelta = timedelta(minutes=3),
+                                      tok: str = None):
+        '''Check progress on command until it's finished. Optionally, wait for vehicle code'''
+        if tok is None:
+            tok = await self._account.get_id_token()
+        prog_c = c.command_progress(tok, self.full_vin, namespace, polling=True)
+        expires = time.time() + timeout.total_seconds()
+        strategy = self._account.polling if sleep is None else FixedPolling(sleep.total_seconds())
+        tracker = ProgressTracker(strategy, namespace, self._account.instrumentation)
+
+        prog = None
+        while True:
+            prog = await self._account.execute(prog_c)
+            if progress_finished(prog, vehicle_code):
+                tracker.finish(prog)
+                break
+            if time.time() > expires:
+                raise AccountError("Command timed out without completing")
+            if self._account.DEBUG:
+                print_progress(prog)
+            await deadline.sleep_async(tracker.update(prog), 'Command {}'.format(namespace))
+        return prog
+
+    async def _run_command(self, builder):
+        self.ensure_vin()
+        tok = await self._account.get_id_token()
+        cmd = builder(tok, self.full_vin)
+        try:
+            await self._account.execute(cmd)
+            await self._process_until_finished(cmd.namespace, vehicle_code='01')
+        finally:
+            # even a failed command may have reached the vehicle
+            self.vehicle._invalidate_status()
+        return True
+
+    async def status(self, force_refresh=False):
+        '''
+        Retrieve the status of the car's components.
+        This includes window and door status, as well
+        as odometer and fuel readings.
+        '''
+        self.ensure_vin()
+        if not force_refresh:
+            # a plain read is a single request; this also goes through the status cache
+            return await self._account._run(self.vehicle.status)
+
+        tok = await self._account.get_id_token()
+        cmd = c.begin_refresh_vehicle_status(tok, self.full_vin)
+        await self._account.execute(cmd)
+        await self._process_until_finished(cmd.namespace)
+        status = await self._account._run(self.vehicle._fetch_status)
+        if self._account.account.status_cache is not None:
+            self._account.account.status_cache.put(self.full_vin, status)
+        return status
+
+    async def watch(self, min_interval: float = None, max_interval: float = None,
+                    refresh: bool = False) -> AsyncIterator[Change]:
+        """Yield a Change for every difference between successive statuses"""
+        self.ensure_vin()
+        cadence = WatchCadence(min_interval, max_interval)
+        last = await self._watch_poll(refresh)
+        interval = cadence.interval
+        while True:
+            await deadline.sleep_async(interval, 'Watch')
+            status = await self._watch_poll(refresh)
+            changes = diff_status(last, status, self.full_vin)
+            last = status
+            for change in changes:
+                yield change
+            interval = cadence.next(bool(changes))
+
+    async def _watch_poll(self, refresh):
+        if refresh:
+            return await self.status(force_refresh=True)
+        return await self._account._run(self.vehicle._watch_poll, False)
+
+    async def get_location(self, force_refresh=False):
+        '''
+        Retrieve the car's last known location. If force_refresh
+        is enabled, the status will be refreshed before checking
+        location.
+        '''
+        self.ensure_vin()
+
+        namespace = "RES"
+        tok = await self._account.get_id_token()
+
+        if force_refresh:
+            cmd = c.begin_refresh_vehicle_status(tok, self.full_vin)
+            await self._account.execute(cmd)
+            prog = await self._process_until_finished(cmd.namespace)
+            # the vehicle has reported a new status
+            self.vehicle._invalidate_status()
+            return prog.location
+
+        prog_c = c.command_progress(tok, self.full_vin, namespace)
+        prog = await self._account.execute(prog_c)
+        return prog.location
+
+    async def run_plan(self, refresh: bool = False, status: bool = True,
+                       location: bool = False) -> PlanResult:
+        """Read the status and/or location with one token and at most one refresh"""
+        self.ensure_vin()
+        if not refresh:
+            return await self._account._run(self.vehicle.run_plan, False, status, location)
+
+        tok = await self._account.get_id_token()
+        result = PlanResult(refreshed=True)
+        cmd = c.begin_refresh_vehicle_status(tok, self.full_vin)
+        await self._account.execute(cmd)
+        prog = await self._process_until_finished(cmd.namespace, tok=tok)
+        if location:
+            result.location = prog.location
+        if status:
+            result.status = await self._account._run(self.vehicle._fetch_status, tok)
+            if self._account.account.status_cache is not None:
+                self._account.account.status_cache.put(self.full_vin, result.status)
+        return result
+
+    async def lock_doors(self):
+        '''Lock the car's doors'''
+        return await self._run_command(c.begin_lock_door)
+
+    async def unlock_doors(self):
+        '''Unlock the car's doors'''
+        return await self._run_command(c.begin_unlock_door)
+
+    async def remote_start(self):
+        '''Remotely start the car'''
+        return await self._run_command(c.begin_remote_start)
+
+    async def remote_stop(self):
+        '''Turn off the car if it was remotely started'''
+        return await self._run_command(c.begin_remote_stop)
@@ -0,0 +1,249 @@
+"""Storage for the account's token and vehicle cache"""
+from contextlib import contextmanager
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, Iterable
+import warnings
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+
+class CacheStore:
+    '''
+    In-memory cache store, used when there is no config file.
+    Subclasses persist the cache. Changed keys are marked dirty
+    and written together, at most every flush_interval seconds.
+    '''
+
+    def __init__(self, flush_interval: float = 0,
+                 encoder=json.JSONEncoder, decoder=json.JSONDecoder):
+        self.flush_interval = flush_interval
+        self.encoder = encoder
+        self.decoder = decoder
+        self._dirty = {}
+        self._last_flush = 0
+        self._timer = None
+        self._lock = threading.RLock()
+
+    def load(self) -> Dict:
+        """Read the whole cache"""
+        return {}
+
+    def reload(self, keys: Iterable[str]) -> Dict:
+        """Read the current stored value of some keys"""
+        return {}
+
+    def save(self, cache: Dict, keys: Iterable[str] = None, flush: bool = False):
+        '''
+        Mark keys (or every key) as changed. They are written
+        immediately if flush is set or the flush interval has passed,
+        otherwise by a timer once it does.
+        '''
+        with self._lock:
+            for key in (cache.keys() if keys is None else keys):
+                self._dirty[key] = cache.get(key)
+            wait = self._last_flush + self.flush_interval - time.time()
+            if flush or wait <= 0:
+                return self.flush()
+            if self._timer is None:
+                self._timer = threading.Timer(wait, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+            return True
+
+    def flush(self) -> bool:
+        """Write every dirty key. Returns False if the write failed"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return True
+            dirty = self._dirty
+            self._dirty = {}
+            try:
+                self._write(dirty)
+            except (IOError, sqlite3.Error) as ex:
+                for key, value in dirty.items():
+                    self._dirty.setdefault(key, value)
+                warnings.warn("Unable to save the account cache: {}".format(ex))
+                return False
+            self._last_flush = time.time()
+            return True
+
+    def _write(self, values: Dict):
+        pass
+
+    @contextmanager
+    def lock(self):
+        '''
+        Hold an exclusive lock shared with other processes using the
+        same store, e.g. so only one of them logs in at a time
+        '''
+        with self._lock:
+            yield
+
+    def close(self):
+        """Write anything outstanding"""
+        self.flush()
+
+
+class JsonCacheStore(CacheStore):
+    '''
+    Keeps the cache in a JSON file. Writes go to a temporary
+    file that is renamed over the original, and merge into what
+    other processes have written rather than replacing it.
+    '''
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._lock_depth = 0
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f, cls=self.decoder)
+        except IOError:
+            return None
+
+    def load(self):
+        return self._read() or {}
+
+    def reload(self, keys):
+        data = self._read() or {}
+        return {k: data[k] for k in keys if k in data}
+
+    def _lock_file(self):
+        '''
+        Open and lock path + '.lock', or return None if it cannot be,
+        e.g. in a missing or read-only directory. The store then only
+        locks within this process, as it cannot persist anything anyway.
+        '''
+        if fcntl is None:
+            return None
+        try:
+            lock_file = open(self.path + '.lock', 'a')
+        except OSError:
+            return None
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        except OSError:
+            lock_file.close()
+            return None
+        return lock_file
+
+    @contextmanager
+    def lock(self):
+        with self._lock:
+            lock_file = None if self._lock_depth else self._lock_file()
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if lock_file is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    lock_file.close()
+
+    def _write(self, values):
+        with self.lock():
+            data = self._read() or {}
+            for key, value in values.items():
+                if value is None:
+                    data.pop(key, None)
+                else:
+                    data[key] = value
+
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp', suffix='.json')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(data, f, sort_keys=True, indent=4, cls=self.encoder)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+
+
+class SqliteCacheStore(CacheStore):
+    '''
+    Keeps each cache key in its own row of a SQLite database,
+    so many processes can share one token and vehicle cache.
+    '''
+    TIMEOUT = 30
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS cache '
+                         '(key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.TIMEOUT,
+                                   isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _decode(self, rows):
+        return {k: json.loads(v, cls=self.decoder) for k, v in rows}
+
+    def load(self):
+        return self._decode(self._connect().execute('SELECT key, value FROM cache'))
+
+    def reload(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        return self._decode(self._connect().execute(
+            'SELECT key, value FROM cache WHERE key IN ({})'.format(','.join('?' * len(keys))),
+            keys))
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        if conn.in_transaction:  # already inside lock()
+            yield conn
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    @contextmanager
+    def lock(self):
+        with self._lock, self._transaction():
+            yield
+
+    def _write(self, values):
+        with self._transaction() as conn:
+            for key, value in values.items():
+                if value is None:
+                    conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+                else:
+                    conn.execute('INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)',
+                                 (key, json.dumps(value, cls=self.encoder)))
+
+    def close(self):
+        super().close()
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
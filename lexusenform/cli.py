@@ -0,0 +1,161 @@
+'''
+Command line interface. Requests are sent to a running
+`lexusenform daemon` over a Unix socket, so each invocation only
+pays for argparse and json; without a daemon they run in-process.
+Credentials are read from LEXUSENFORM_EMAIL and LEXUSENFORM_PASSWORD.
+'''
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+
+
+def default_socket() -> str:
+    """Socket path from LEXUSENFORM_SOCKET, or one per user in the runtime dir"""
+    path = os.environ.get('LEXUSENFORM_SOCKET')
+    if path:
+        return path
+    base = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(base, 'lexusenform-{}.sock'.format(os.getuid()))
+
+
+def default_config() -> str:
+    return os.environ.get('LEXUSENFORM_CONFIG') or os.path.expanduser('~/.lexusenform.json')
+
+
+def _credentials():
+    email = os.environ.get('LEXUSENFORM_EMAIL')
+    password = os.environ.get('LEXUSENFORM_PASSWORD')
+    if not email:
+        email = input('Email: ')
+    if not password:
+        import getpass  # pylint: disable=C0415
+        password = getpass.getpass()
+    return email, password
+
+
+def send(request, socket_path: str, timeout: float = 300):
+    '''
+    Send a request to the daemon and return its reply. Raises
+    FileNotFoundError or ConnectionRefusedError if no daemon is
+    listening, and socket.timeout if it does not answer in time.
+    '''
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        data = b''
+        while not data.endswith(b'\n'):
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    finally:
+        sock.close()
+    return json.loads(data.decode('utf-8'))
+
+
+def run_local(request, config_file: str):
+    """Run a request in this process, without a daemon"""
+    from .daemon import Daemon  # pylint: disable=C0415
+    email, password = _credentials()
+    return Daemon.create(email, password, config_file, None).handle(request)
+
+
+def _print_reply(reply, as_json):
+    if as_json:
+        print(json.dumps(reply.get('result'), indent=2))
+        return
+    result = reply['result']
+    if reply.get('all'):
+        for vin, res in result.items():
+            print('{}:'.format(vin))
+            print(res['result'] if res['ok'] else 'Error: {}'.format(res['error']))
+    elif isinstance(result, list):
+        for veh in result:
+            print('{vin}  {year} {make} {model}'.format(**veh))
+    else:
+        print(result)
+
+
+def _parser():
+    parser = argparse.ArgumentParser(prog='lexusenform', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--socket', default=default_socket(), help='daemon socket path')
+    parser.add_argument('--config', default=default_config(), help='token and vehicle cache')
+    parser.add_argument('--no-daemon', action='store_true',
+                        help='run in this process even if a daemon is listening')
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+
+    sub.add_parser('daemon', help='serve requests on the socket')
+    sub.add_parser('ping', help='check that the daemon is running')
+    vehicles = sub.add_parser('vehicles', help='list vehicles on the account')
+    vehicles.add_argument('--refresh', action='store_true', help='reload from the service')
+    vehicles.add_argument('--json', action='store_true')
+    for name, text in (('status', 'door, window and fuel status'),
+                       ('location', 'last known location'),
+                       ('lock', 'lock the doors'),
+                       ('unlock', 'unlock the doors'),
+                       ('start', 'remote start'),
+                       ('stop', 'remote stop')):
+        cmd = sub.add_parser(name, help=text)
+        cmd.add_argument('vin', nargs='?', help='full VIN; optional with a single vehicle')
+        cmd.add_argument('--all', action='store_true', help='every vehicle on the account')
+        cmd.add_argument('--json', action='store_true')
+        if name in ('status', 'location'):
+            cmd.add_argument('--refresh', action='store_true',
+                             help='ask the vehicle for a fresh status first')
+    return parser
+
+
+def main(argv=None):
+    args = _parser().parse_args(argv)
+
+    if args.command == 'daemon':
+        from .daemon import Daemon  # pylint: disable=C0415
+        email, password = _credentials()
+        daemon = Daemon.create(email, password, args.config, args.socket)
+        print('Listening on {}'.format(args.socket))
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    request = {
+        'command': args.command,
+        'vin': getattr(args, 'vin', None),
+        'all': getattr(args, 'all', False),
+        'force_refresh': getattr(args, 'refresh', False),
+        'json': getattr(args, 'json', False),
+    }
+    reply = None
+    if not args.no_daemon:
+        try:
+            reply = send(request, args.socket)
+        except (FileNotFoundError, ConnectionRefusedError):
+            if args.command == 'ping':
+                print('No daemon listening on {}'.format(args.socket), file=sys.stderr)
+                return 1
+        except socket.timeout:
+            # the command may still complete, so do not run it again here
+            print('Error: the daemon did not reply in time', file=sys.stderr)
+            return 1
+    if reply is None:
+        reply = run_local(request, args.config)
+
+    if not reply['ok']:
+        print('Error: {}'.format(reply['error']), file=sys.stderr)
+        return 1
+    _print_reply(reply, request['json'])
+    if reply.get('all') and not all(r['ok'] for r in reply['result'].values()):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
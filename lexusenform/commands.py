@@ -5,7 +5,8 @@ from . import response_parsers as rp
 
 class Command:
     def __init__(self, body: str, path: str, response_parser: rp.ResponseParser,
-                 namespace: str = None, query: Dict = None, headers: Dict = None):
+                 namespace: str = None, query: Dict = None, headers: Dict = None,
+                 idempotent: bool = False, vin: str = None, polling: bool = False):
         if isinstance(body, et.Element):
             self.body = et.tostring(body)
         else:
@@ -15,83 +16,82 @@ class Command:
         self.namespace = namespace
         self.query = query
         self.headers = headers
+        # Safe to send again if the first attempt may have reached the server
+        self.idempotent = idempotent
+        self.vin = vin
+        # Part of a progress polling loop, so an unknown progress
+        # may be polled again rather than returned
+        self.polling = polling
 
 class Commands:
-    @staticmethod
-    def __get_root():
-        return et.Element('SPML')
+    # Constant parts of every request, pre-serialized exactly as
+    # ElementTree would write them. Only the token, VIN and config
+    # values are escaped and filled in per command.
+    _COMMON_START = b'<SPML><COMMON>'
+    _COMMON_MIDDLE = (b'<LANG>en</LANG><VERSION>Android</VERSION>'
+                      b'<DEVICE><SERIAL_NO>00000000</SERIAL_NO><TEL_NO>0000000000</TEL_NO>'
+                      b'<TYPE>Android</TYPE></DEVICE><USER>')
+    _COMMON_END = b'</USER><SESSION /></COMMON>'
+    _POSITION = (b'<POSITION><LAT>0.000000</LAT><LON>0.000000</LON>'
+                 b'<ACCURACY>65.000000</ACCURACY></POSITION>')
+    _END = b'</SPML>'
 
     @staticmethod
-    def __add_common(root, token, vin):
-        common = et.SubElement(root, 'COMMON')
-
-        auth = et.SubElement(common, 'AUTH')
-        auth.set("REGION", "US")
-        auth.text = token
-
-        lang = et.SubElement(common, "LANG")
-        lang.text = "en"
-
-        version = et.SubElement(common, "VERSION")
-        version.text = "Android"
-
-        device = et.SubElement(common, "DEVICE")
-        serial = et.SubElement(device, "SERIAL_NO")
-        serial.text = "00000000"
-        tel = et.SubElement(device, "TEL_NO")
-        tel.text = "0000000000"
-        dev_type = et.SubElement(device, "TYPE")
-        dev_type.text = "Android"
-
-        user = et.SubElement(common, "USER")
-        user_id = et.SubElement(user, "USER_ID")
-        user_id.text = vin
-
-        et.SubElement(common, "SESSION")
+    def __escape(value):
+        return (value.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+                .encode('ascii', 'xmlcharrefreplace'))
 
     @staticmethod
-    def __add_fake_position(root):
-        position = et.SubElement(root, "POSITION")
-        lat = et.SubElement(position, "LAT")
-        lat.text = "0.000000"
-        lon = et.SubElement(position, "LON")
-        lon.text = "0.000000"
-        acc = et.SubElement(position, "ACCURACY")
-        acc.text = "65.000000"
+    def __element(tag, value):
+        if not value:
+            return '<{} />'.format(tag).encode('ascii')
+        return b''.join((b'<', tag.encode('ascii'), b'>', Commands.__escape(value),
+                         b'</', tag.encode('ascii'), b'>'))
 
     @staticmethod
-    def __add_command(root, value):
-        cmd = et.SubElement(root, "COMMAND")
-        cmd.text = value
+    def __common(token, vin):
+        if token:
+            auth = b''.join((b'<AUTH REGION="US">', Commands.__escape(token), b'</AUTH>'))
+        else:
+            auth = b'<AUTH REGION="US" />'
+        return b''.join((Commands._COMMON_START, auth, Commands._COMMON_MIDDLE,
+                         Commands.__element('USER_ID', vin), Commands._COMMON_END))
 
     @staticmethod
-    def __add_config(root, key, value):
-        cmd = et.SubElement(root, key)
-        cmd.text = value
+    def __begin(token, vin, namespace, value):
+        return b''.join((Commands.__common(token, vin),
+                         Commands.__element(namespace, value),
+                         Commands._POSITION, Commands._END))
 
     @staticmethod
-    def command_progress(token, vin, namespace):
-        """Command for execution progress."""
-        root = Commands.__get_root()
-        Commands.__add_common(root, token, vin)
-        Commands.__add_command(root, namespace)
-        return Command(root,
+    def command_progress(token, vin, namespace, polling=False):
+        '''
+        Command for execution progress. polling is set while
+        waiting for a command to finish, as opposed to a one-off read.
+        '''
+        body = b''.join((Commands.__common(token, vin),
+                         Commands.__element('COMMAND', namespace), Commands._END))
+        return Command(body,
                        "/get_remote_control_status_and_latest_info.aspx",
                        rp.ProgressParser,
+                       vin=vin,
                        namespace = namespace,
+                       idempotent=True,
+                       polling=polling,
                        headers={
                            'Content-Type': 'text/plain charset=ISO-8859-1',
                            'Authorization': 'Bearer ' + token
                        })
 
     @staticmethod
-    def vehicle_status(token, vin):
+    def vehicle_status(token, vin, response_parser=rp.StatusParser):
         """Command for vehicle status, locks, windows, etc."""
-        root = Commands.__get_root()
-        Commands.__add_common(root, token, vin)
-        return Command(root,
+        body = Commands.__common(token, vin) + Commands._END
+        return Command(body,
                        "/get_realtime_status.aspx",
-                       rp.StatusParser,
+                       response_parser,
+                       vin=vin,
+                       idempotent=True,
                        query={
                            'VIN': vin
                        },
@@ -104,13 +104,11 @@ class Commands:
     def begin_refresh_vehicle_status(token, vin):
         """Command to start a vehicle status refresh"""
         ns = 'REALTIMESTATUSREQUEST'
-        root = Commands.__get_root()
-        Commands.__add_common(root, token, vin)
-        Commands.__add_config(root, ns, '1')
-        Commands.__add_fake_position(root)
-        return Command(root,
+        body = Commands.__begin(token, vin, ns, '1')
+        return Command(body,
                        "/remote_control.aspx",
                        rp.BasicCommandResponseParser,
+                       vin=vin,
                        namespace = ns,
                        query={
                            'command': 'VehicleRefresh',
@@ -124,13 +122,11 @@ class Commands:
     def begin_lock_door(token, vin):
         """Command to start a vehicle door lock"""
         ns = 'DL'
-        root = Commands.__get_root()
-        Commands.__add_common(root, token, vin)
-        Commands.__add_config(root, ns, '1')
-        Commands.__add_fake_position(root)
-        return Command(root,
+        body = Commands.__begin(token, vin, ns, '1')
+        return Command(body,
                        "/remote_control.aspx",
                        rp.BasicCommandResponseParser,
+                       vin=vin,
                        namespace = ns,
                        query={
                            'command': 'DoorLock',
@@ -144,13 +140,11 @@ class Commands:
     def begin_unlock_door(token, vin):
         """Command to start a vehicle door unlock"""
         ns = 'DL'
-        root = Commands.__get_root()
-        Commands.__add_common(root, token, vin)
-        Commands.__add_config(root, ns, '2')
-        Commands.__add_fake_position(root)
-        return Command(root,
+        body = Commands.__begin(token, vin, ns, '2')
+        return Command(body,
                        "/remote_control.aspx",
                        rp.BasicCommandResponseParser,
+                       vin=vin,
                        namespace = ns,
                        query={
                            'command': 'DoorLock',
@@ -164,13 +158,11 @@ class Commands:
     def begin_remote_start(token, vin):
         """Command to start a vehicle"""
         ns = 'RES'
-        root = Commands.__get_root()
-        Commands.__add_common(root, token, vin)
-        Commands.__add_config(root, ns, '1')
-        Commands.__add_fake_position(root)
-        return Command(root,
+        body = Commands.__begin(token, vin, ns, '1')
+        return Command(body,
                        "/remote_control.aspx",
                        rp.BasicCommandResponseParser,
+                       vin=vin,
                        namespace = ns,
                        query={
                            'command': 'RemoteStart',
@@ -184,13 +176,11 @@ class Commands:
     def begin_remote_stop(token, vin):
         """Command to stop a vehicle that was remotely started"""
         ns = 'RES'
-        root = Commands.__get_root()
-        Commands.__add_common(root, token, vin)
-        Commands.__add_config(root, ns, '2')
-        Commands.__add_fake_position(root)
-        return Command(root,
+        body = Commands.__begin(token, vin, ns, '2')
+        return Command(body,
                        "/remote_control.aspx",
                        rp.BasicCommandResponseParser,
+                       vin=vin,
                        namespace = ns,
                        query={
                            'command': 'RemoteStop',
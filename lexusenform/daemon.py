@@ -0,0 +1,193 @@
+"""Long-lived process serving a warm Account over a Unix socket"""
+import json
+import os
+import socketserver
+import threading
+from typing import Dict
+
+from .account import Account
+from .deadline import Deadline
+from .models import COMPONENT_SLOTS, VehicleStatus
+from .status_cache import StatusCache
+from . import AccountError
+
+# CLI command -> (Vehicle method, whether it takes force_refresh)
+OPERATIONS = {
+    'status': ('status', True),
+    'location': ('get_location', True),
+    'lock': ('lock_doors', False),
+    'unlock': ('unlock_doors', False),
+    'start': ('remote_start', False),
+    'stop': ('remote_stop', False),
+}
+
+
+def _measurement(value):
+    return None if value is None else {'value': value[0], 'unit': value[1]}
+
+
+def status_to_dict(status: VehicleStatus) -> Dict:
+    """A VehicleStatus as plain, JSON serializable data"""
+    ret = {
+        'last_updated_date': (status.last_updated_date.isoformat()
+                              if status.last_updated_date else None),
+        'dashboard_date': status.dashboard_date.isoformat() if status.dashboard_date else None,
+        'odometer': _measurement(status.odometer),
+        'fuel_gauge': _measurement(status.fuel_gauge),
+        'drive_range': _measurement(status.drive_range),
+        'trip_a': _measurement(status.trip_a),
+        'trip_b': _measurement(status.trip_b),
+        'hazards_on': status.hazards_on,
+    }
+    for group, key in COMPONENT_SLOTS:
+        comp = getattr(status, group)[key]
+        ret.setdefault(group, {})[key] = {
+            'closed': comp.closed, 'locked': comp.locked, 'safe': comp.safe}
+    return ret
+
+
+def _encode(command, value, as_json):
+    if command == 'status':
+        return status_to_dict(value) if as_json else str(value)
+    if command == 'location':
+        return {'lat': value[0], 'lon': value[1]} if as_json else '{}, {}'.format(*value)
+    return value if as_json else 'OK'
+
+
+class Daemon:
+    '''
+    Holds one Account, with its tokens, connections and status
+    cache, and runs CLI requests against it. Requests and replies
+    are single lines of JSON.
+    '''
+    # Seconds a request may run; less than the CLI waits for a reply
+    REQUEST_TIMEOUT = 280
+
+    def __init__(self, account: Account, socket_path: str):
+        self.account = account
+        self.socket_path = socket_path
+        self.server = None
+        # parent of every request's deadline, cancelled on shutdown
+        self.deadline = Deadline()
+        if account.status_cache is None:
+            account.status_cache = StatusCache()
+
+    @classmethod
+    def create(cls, email: str, password: str, config_file: str, socket_path: str,
+               **kwargs) -> 'Daemon':
+        """Create a daemon for a new Account"""
+        return cls(Account(email, password, config_file, **kwargs), socket_path)
+
+    def warm(self):
+        """Connect and log in ahead of the first request"""
+        self.account.warm_up()
+        self.account.get_id_token()
+        self.account.vehicles()
+
+    def _vehicle(self, vin):
+        if vin is None:
+            vehicles = self.account.vehicles()
+            if len(vehicles) != 1:
+                raise AccountError(
+                    "There are {} vehicles on this account; give a VIN or --all".format(
+                        len(vehicles)))
+            return vehicles[0]
+        veh = self.account.vehicle(vin)
+        if veh is None:
+            raise AccountError("No vehicle with VIN {}".format(vin))
+        return veh
+
+    def handle(self, request: Dict) -> Dict:
+        '''
+        Run one request, returning the reply. It is given up after
+        the request's timeout, REQUEST_TIMEOUT seconds by default.
+        '''
+        with Deadline(request.get('timeout') or self.REQUEST_TIMEOUT, self.deadline):
+            return self._handle(request)
+
+    def _handle(self, request: Dict) -> Dict:
+        command = request.get('command')
+        as_json = request.get('json', False)
+        try:
+            if command == 'ping':
+                return {'ok': True, 'result': 'pong'}
+            if command == 'vehicles':
+                vehicles = self.account.vehicles(request.get('force_refresh', False))
+                return {'ok': True, 'result': [{
+                    'vehicle_id': v.vehicle_id,
+                    'vin': v.full_vin or v.partial_vin,
+                    'make': v.make,
+                    'model': v.model,
+                    'year': v.year,
+                } for v in vehicles]}
+            if command not in OPERATIONS:
+                raise AccountError("Unknown command {}".format(command))
+
+            method, refreshable = OPERATIONS[command]
+            kwargs = {'force_refresh': request.get('force_refresh', False)} if refreshable else {}
+            if not request.get('all'):
+                veh = self._vehicle(request.get('vin'))
+                value = getattr(veh, method)(**kwargs)
+                return {'ok': True, 'result': _encode(command, value, as_json)}
+
+            results = {}
+            for res in self.account.fleet().apply(method, **kwargs):
+                vin = res.item.full_vin or res.item.partial_vin
+                if res.ok:
+                    results[vin] = {'ok': True, 'result': _encode(command, res.value, as_json)}
+                else:
+                    results[vin] = {'ok': False, 'error': str(res.error)}
+            return {'ok': True, 'result': results, 'all': True}
+        except Exception as ex:  # pylint: disable=W0703
+            return {'ok': False, 'error': str(ex) or type(ex).__name__}
+
+    def serve_forever(self, warm: bool = True):
+        '''
+        Listen on the socket until shutdown() is called. The socket
+        is only accessible to the current user.
+        '''
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        request = json.loads(line.decode('utf-8'))
+                    except ValueError:
+                        reply = {'ok': False, 'error': 'Malformed request'}
+                    else:
+                        reply = daemon.handle(request)
+                    self.wfile.write(json.dumps(reply).encode('utf-8') + b'\n')
+                    self.wfile.flush()
+
+        old_umask = os.umask(0o177)
+        try:
+            self.server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        finally:
+            os.umask(old_umask)
+        self.server.daemon_threads = True
+        if warm:
+            threading.Thread(target=self._warm_quietly, daemon=True).start()
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def _warm_quietly(self):
+        try:
+            self.warm()
+        except Exception:  # pylint: disable=W0703
+            pass  # the first request will report the problem
+
+    def shutdown(self):
+        '''
+        Stop serve_forever from another thread. Requests still
+        running are cancelled rather than waited for.
+        '''
+        self.deadline.cancel()
+        if self.server is not None:
+            self.server.shutdown()
@@ -0,0 +1,196 @@
+"""Deadlines and cancellation for commands, token refresh and polling"""
+import asyncio
+import contextvars
+import threading
+import time
+
+from . import AccountError
+
+_current = contextvars.ContextVar('lexusenform_deadline', default=None)
+
+
+def _budget(remaining):
+    if remaining is None:
+        return 'no time limit'
+    return '{:.1f}s of its deadline left'.format(max(remaining, 0))
+
+
+class DeadlineExceeded(AccountError):
+    '''
+    An operation could not finish within its deadline. remaining is
+    the budget, in seconds, that was left when it gave up, or None
+    without a time limit.
+    '''
+
+    def __init__(self, message: str, remaining: float = None):
+        super().__init__('{} ({})'.format(message, _budget(remaining)))
+        self.remaining = remaining
+
+
+class OperationCancelled(DeadlineExceeded):
+    '''The operation's deadline was cancelled while it was running'''
+
+
+class Deadline:
+    '''
+    Time budget and cancellation for everything run inside
+    ``with deadline:``, on this thread or asyncio task. Requests get
+    a timeout no longer than the remaining budget, and waits between
+    retries, polls, scheduler slots and token refreshes end as soon
+    as the budget runs out or cancel() is called. A request already
+    on the wire finishes or times out first.
+
+    A deadline created inside another one never outlives it and is
+    cancelled along with it.
+    '''
+
+    def __init__(self, seconds: float = None, parent: 'Deadline' = None):
+        self.parent = parent if parent is not None else _current.get()
+        self.expires = None if seconds is None else time.monotonic() + seconds
+        if self.parent is not None and self.parent.expires is not None:
+            if self.expires is None or self.parent.expires < self.expires:
+                self.expires = self.parent.expires
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._tokens = []
+        if self.parent is not None:
+            self.parent.on_cancel(self.cancel)
+            if self.parent.cancelled:
+                self._event.set()
+
+    def __enter__(self):
+        self._tokens.append(_current.set(self))
+        return self
+
+    def __exit__(self, *exc):
+        _current.reset(self._tokens.pop())
+        if self.parent is not None and not self._tokens:
+            self.parent.remove_callback(self.cancel)
+
+    def remaining(self) -> float:
+        """Seconds left, or None without a time limit"""
+        if self.expires is None:
+            return None
+        return self.expires - time.monotonic()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        """Cancel every operation running under this deadline"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback):
+        """Call callback when the deadline is cancelled"""
+        with self._lock:
+            self._callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def check(self, what: str = 'Operation', seconds: float = 0):
+        '''
+        Raise OperationCancelled if cancelled, or DeadlineExceeded
+        if fewer than seconds remain
+        '''
+        remaining = self.remaining()
+        if self._event.is_set():
+            raise OperationCancelled('{} was cancelled'.format(what), remaining)
+        if remaining is not None and remaining <= seconds:
+            if seconds:
+                raise DeadlineExceeded(
+                    '{} cannot finish before its deadline'.format(what), remaining)
+            raise DeadlineExceeded('{} ran past its deadline'.format(what), remaining)
+
+    def timeout(self, default: float = None) -> float:
+        """Request timeout: the remaining budget, capped at default"""
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        return remaining if default is None else min(default, remaining)
+
+    def sleep(self, seconds: float, what: str = 'Operation'):
+        '''
+        Sleep unless cancelled. Raises at once when the deadline
+        would pass first, since the caller could not act after it.
+        '''
+        self.check(what, seconds)
+        if self._event.wait(seconds):
+            self.check(what)
+
+    async def sleep_async(self, seconds: float, what: str = 'Operation'):
+        """sleep() for coroutines, also woken at once by cancel()"""
+        self.check(what, seconds)
+        loop = asyncio.get_running_loop()
+        woken = loop.create_future()
+
+        def wake():
+            try:
+                loop.call_soon_threadsafe(
+                    lambda: woken.done() or woken.set_result(None))
+            except RuntimeError:
+                pass  # the loop has already closed
+
+        self.on_cancel(wake)
+        try:
+            if not self.cancelled:
+                await asyncio.wait_for(woken, seconds)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.remove_callback(wake)
+        self.check(what)
+
+    def wait(self, cond: threading.Condition, timeout: float = None,
+             what: str = 'Operation'):
+        '''
+        cond.wait(timeout), also woken by cancel() and ending with
+        the deadline. Must be called with cond held.
+        '''
+        def wake():
+            with cond:
+                cond.notify_all()
+
+        self.on_cancel(wake)
+        try:
+            self.check(what)
+            remaining = self.remaining()
+            if remaining is not None and (timeout is None or remaining < timeout):
+                timeout = remaining
+            cond.wait(timeout)
+        finally:
+            self.remove_callback(wake)
+        self.check(what)
+
+
+def current() -> Deadline:
+    """The deadline of the running operation, or None"""
+    return _current.get()
+
+
+def sleep(seconds: float, what: str = 'Operation'):
+    """time.sleep(), honouring the current deadline if there is one"""
+    deadline = _current.get()
+    if deadline is None:
+        time.sleep(seconds)
+    else:
+        deadline.sleep(seconds, what)
+
+
+async def sleep_async(seconds: float, what: str = 'Operation'):
+    """asyncio.sleep(), honouring the current deadline if there is one"""
+    deadline = _current.get()
+    if deadline is None:
+        await asyncio.sleep(seconds)
+    else:
+        await deadline.sleep_async(seconds, what)
@@ -0,0 +1,95 @@
+"""Run operations across many vehicles at once"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import contextvars
+from typing import Callable, Iterable, Iterator, List, Union
+
+
+class BatchResult:
+    '''Outcome of one item in a batch. Exactly one of value or error is set'''
+
+    def __init__(self, item, value=None, error: Exception = None):
+        self.item = item
+        self.value = value
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        """True if the operation did not raise"""
+        return self.error is None
+
+    def __repr__(self):
+        if self.ok:
+            return '<BatchResult {!r}: {!r}>'.format(self.item, self.value)
+        return '<BatchResult {!r}: error {!r}>'.format(self.item, self.error)
+
+
+def _capture(item, func, args, kwargs) -> BatchResult:
+    try:
+        return BatchResult(item, value=func(*args, **kwargs))
+    except Exception as ex:  # pylint: disable=W0703
+        return BatchResult(item, error=ex)
+
+
+class BatchExecutor:
+    '''
+    Runs a callable over many items on a bounded worker pool.
+    Errors are captured per item instead of aborting the batch.
+    '''
+    MAX_WORKERS = 16
+
+    def __init__(self, max_workers: int = None):
+        self.max_workers = max_workers or self.MAX_WORKERS
+
+    def submit_all(self, items: Iterable, func: Callable, *args, **kwargs) -> List:
+        '''
+        Start func(item, *args, **kwargs) for every item, under the
+        caller's deadline if there is one.
+        Returns a list of futures resolving to BatchResult, in item order.
+        '''
+        items = list(items)
+        pool = ThreadPoolExecutor(max(1, min(self.max_workers, len(items))))
+        try:
+            return [pool.submit(contextvars.copy_context().run, _capture,
+                                item, func, (item,) + args, kwargs)
+                    for item in items]
+        finally:
+            pool.shutdown(wait=False)
+
+    def as_completed(self, items: Iterable, func: Callable, *args, **kwargs) -> Iterator[BatchResult]:
+        """Yield each BatchResult as soon as it is ready"""
+        for fut in as_completed(self.submit_all(items, func, *args, **kwargs)):
+            yield fut.result()
+
+    def run(self, items: Iterable, func: Callable, *args, **kwargs) -> List[BatchResult]:
+        """Run the batch and return every BatchResult, in item order"""
+        return [fut.result() for fut in self.submit_all(items, func, *args, **kwargs)]
+
+
+class Fleet(BatchExecutor):
+    '''
+    A set of vehicles operated on together. Operations are either
+    the name of a Vehicle method, like 'status' or 'lock_doors',
+    or a callable taking the vehicle as its first argument.
+    '''
+
+    def __init__(self, vehicles: Iterable, max_workers: int = None):
+        super().__init__(max_workers)
+        self.vehicles = list(vehicles)
+
+    @staticmethod
+    def _operation(operation: Union[str, Callable]) -> Callable:
+        if callable(operation):
+            return operation
+        return lambda vehicle, *args, **kwargs: getattr(vehicle, operation)(*args, **kwargs)
+
+    def submit(self, operation: Union[str, Callable], *args, **kwargs) -> List:
+        """Start the operation on every vehicle, returning futures"""
+        return self.submit_all(self.vehicles, self._operation(operation), *args, **kwargs)
+
+    def each_completed(self, operation: Union[str, Callable], *args, **kwargs) -> Iterator[BatchResult]:
+        """Run the operation on every vehicle, yielding results as they finish"""
+        return self.as_completed(self.vehicles, self._operation(operation), *args, **kwargs)
+
+    def apply(self, operation: Union[str, Callable], *args, **kwargs) -> List[BatchResult]:
+        """Run the operation on every vehicle, returning results in vehicle order"""
+        return self.run(self.vehicles, self._operation(operation), *args, **kwargs)
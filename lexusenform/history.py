@@ -0,0 +1,300 @@
+"""Append-only, columnar history of vehicle statuses"""
+from array import array
+from bisect import bisect_left, bisect_right
+import json
+import mmap
+import os
+import shutil
+import threading
+from typing import Dict, Iterable
+
+from .models import COMPONENT_SLOTS, VehicleStatus
+from .timestamps import epoch_seconds
+
+NAN = float('nan')
+
+# Column name -> array typecode
+COLUMNS = (
+    ('ts', 'd'),            # dashboard date, seconds since the epoch
+    ('updated', 'd'),       # last updated date, seconds since the epoch
+    ('vehicle', 'i'),       # index into the vehicle list
+    ('odometer', 'd'),
+    ('fuel_gauge', 'd'),
+    ('drive_range', 'd'),
+    ('trip_a', 'd'),
+    ('trip_b', 'd'),
+    ('hazards_on', 'b'),
+    # component flags, one bit per COMPONENT_SLOTS entry
+    ('closed', 'I'),
+    ('closed_known', 'I'),
+    ('locked', 'I'),
+    ('locked_known', 'I'),
+    ('safe', 'I'),
+)
+TYPECODES = dict(COLUMNS)
+MEASUREMENTS = ('odometer', 'fuel_gauge', 'drive_range', 'trip_a', 'trip_b')
+
+
+def pack_components(status: VehicleStatus):
+    '''
+    Pack the component flags of a status into
+    (closed, closed_known, locked, locked_known, safe) bitsets
+    '''
+    closed = closed_known = locked = locked_known = safe = 0
+    for bit, (group, key) in enumerate(COMPONENT_SLOTS):
+        comp = getattr(status, group)[key]
+        mask = 1 << bit
+        if comp.closed is not None:
+            closed_known |= mask
+            if comp.closed:
+                closed |= mask
+        if comp.locked is not None:
+            locked_known |= mask
+            if comp.locked:
+                locked |= mask
+        if comp.safe:
+            safe |= mask
+    return closed, closed_known, locked, locked_known, safe
+
+
+class _Segment:
+    """An immutable, memory-mapped set of column files"""
+
+    def __init__(self, path):
+        self.path = path
+        self.columns = {}
+        self._maps = []
+        for name, code in COLUMNS:
+            col_path = os.path.join(path, name + '.bin')
+            if os.path.getsize(col_path) == 0:
+                self.columns[name] = array(code)
+                continue
+            with open(col_path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps.append(mapped)
+            self.columns[name] = memoryview(mapped).cast(code)
+        self.rows = len(self.columns['ts'])
+
+    @staticmethod
+    def write(path, columns: Dict[str, array]):
+        """Write columns, sorted by timestamp, as a new segment"""
+        order = sorted(range(len(columns['ts'])), key=columns['ts'].__getitem__)
+        tmp = path + '.tmp'
+        os.makedirs(tmp)
+        for name, code in COLUMNS:
+            col = columns[name]
+            with open(os.path.join(tmp, name + '.bin'), 'wb') as f:
+                array(code, (col[i] for i in order)).tofile(f)
+        os.rename(tmp, path)
+
+    def close(self):
+        for name in list(self.columns):
+            if isinstance(self.columns[name], memoryview):
+                self.columns[name].release()
+        self.columns = {}
+        for mapped in self._maps:
+            mapped.close()
+        self._maps = []
+
+
+class StatusHistory:
+    '''
+    Append-only store of VehicleStatus snapshots. Rows are kept
+    in columns: recent appends in memory, older ones in
+    memory-mapped segment files sorted by dashboard date, so
+    scans run over arrays rather than Python objects.
+    '''
+    SEGMENT_ROWS = 65536
+
+    def __init__(self, path: str, segment_rows: int = None):
+        self.path = path
+        self.segment_rows = segment_rows or self.SEGMENT_ROWS
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+
+        self.vehicles = []
+        self.units = {}
+        meta = self._meta_path()
+        if os.path.exists(meta):
+            with open(meta) as f:
+                data = json.load(f)
+            self.vehicles = data['vehicles']
+            self.units = data['units']
+        self._vehicle_index = {vin: i for i, vin in enumerate(self.vehicles)}
+
+        self.segments = [_Segment(os.path.join(path, name))
+                         for name in sorted(os.listdir(path)) if name.startswith('seg-')
+                         and not name.endswith('.tmp')]
+        self._buffer = self._empty()
+        self._latest = None
+
+    def _meta_path(self):
+        return os.path.join(self.path, 'meta.json')
+
+    @staticmethod
+    def _empty():
+        return {name: array(code) for name, code in COLUMNS}
+
+    def __len__(self):
+        return sum(s.rows for s in self.segments) + len(self._buffer['ts'])
+
+    def append(self, vin: str, status: VehicleStatus):
+        """Record a status snapshot for a vehicle"""
+        with self._lock:
+            idx = self._vehicle_index.get(vin)
+            if idx is None:
+                idx = len(self.vehicles)
+                self.vehicles.append(vin)
+                self._vehicle_index[vin] = idx
+            units = self.units.setdefault(vin, {})
+
+            buf = self._buffer
+            buf['ts'].append(epoch_seconds(status.dashboard_date))
+            buf['updated'].append(epoch_seconds(status.last_updated_date))
+            buf['vehicle'].append(idx)
+            for name in MEASUREMENTS:
+                value = getattr(status, name)
+                if value is None:
+                    buf[name].append(NAN)
+                else:
+                    buf[name].append(value[0])
+                    units[name] = value[1]
+            buf['hazards_on'].append(1 if status.hazards_on else 0)
+            for name, bits in zip(('closed', 'closed_known', 'locked', 'locked_known', 'safe'),
+                                  pack_components(status)):
+                buf[name].append(bits)
+
+            if self._latest is not None:
+                ts = buf['ts'][-1]
+                if idx not in self._latest or not ts < self._latest[idx][0]:
+                    self._latest[idx] = (ts, None, len(buf['ts']) - 1)
+            if len(buf['ts']) >= self.segment_rows:
+                self.flush()
+
+    def flush(self):
+        """Write buffered rows to a new segment"""
+        with self._lock:
+            if len(self._buffer['ts']):
+                # segments refer to vehicles by index, so save those first
+                self._save_meta()
+                name = 'seg-{:08d}'.format(self._next_segment_number())
+                path = os.path.join(self.path, name)
+                _Segment.write(path, self._buffer)
+                self.segments.append(_Segment(path))
+                self._buffer = self._empty()
+                self._latest = None
+            else:
+                self._save_meta()
+
+    def _next_segment_number(self):
+        if not self.segments:
+            return 1
+        return int(os.path.basename(self.segments[-1].path)[4:]) + 1
+
+    def _save_meta(self):
+        tmp = self._meta_path() + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'vehicles': self.vehicles, 'units': self.units}, f)
+        os.replace(tmp, self._meta_path())
+
+    def _sources(self):
+        for seg in self.segments:
+            yield seg, seg.columns, seg.rows, True
+        yield None, self._buffer, len(self._buffer['ts']), False
+
+    def scan(self, start: float = None, end: float = None, vin: str = None,
+             columns: Iterable[str] = None) -> Dict[str, array]:
+        '''
+        Rows with a dashboard date in [start, end], optionally for
+        one vehicle, as a dict of column name to array
+        '''
+        names = list(columns) if columns is not None else [n for n, _ in COLUMNS]
+        out = {name: array(TYPECODES[name]) for name in names}
+        vehicle = None
+        if vin is not None:
+            vehicle = self._vehicle_index.get(vin)
+            if vehicle is None:
+                return out
+
+        with self._lock:
+            for _, cols, rows, is_sorted in self._sources():
+                ts = cols['ts']
+                if is_sorted:
+                    lo = 0 if start is None else bisect_left(ts, start)
+                    hi = rows if end is None else bisect_right(ts, end)
+                    idx = range(lo, hi)
+                else:
+                    idx = [i for i in range(rows)
+                           if (start is None or ts[i] >= start) and (end is None or ts[i] <= end)]
+                if vehicle is not None:
+                    veh = cols['vehicle']
+                    idx = [i for i in idx if veh[i] == vehicle]
+                for name in names:
+                    col = cols[name]
+                    if isinstance(idx, range):
+                        out[name].frombytes(col[idx.start:idx.stop].tobytes())
+                    else:
+                        out[name].extend(col[i] for i in idx)
+        return out
+
+    def row(self, cols, i) -> Dict:
+        """One row of a scan result, as a dict keyed by column"""
+        ret = {name: cols[name][i] for name in cols}
+        if 'vehicle' in ret:
+            ret['vin'] = self.vehicles[ret['vehicle']]
+        return ret
+
+    def latest(self) -> Dict[str, Dict]:
+        """The most recent row for every vehicle, keyed by VIN"""
+        with self._lock:
+            if self._latest is None:
+                latest = {}
+                for seg, cols, rows, _ in self._sources():
+                    ts = cols['ts']
+                    veh = cols['vehicle']
+                    for i in range(rows):
+                        v = veh[i]
+                        if v not in latest or not ts[i] < latest[v][0]:
+                            latest[v] = (ts[i], seg, i)
+                self._latest = latest
+
+            ret = {}
+            for v, (_, seg, i) in self._latest.items():
+                cols = seg.columns if seg is not None else self._buffer
+                row = {name: cols[name][i] for name, _ in COLUMNS}
+                row['vin'] = self.vehicles[v]
+                ret[self.vehicles[v]] = row
+            return ret
+
+    def compact(self):
+        '''
+        Merge the buffer and all segments into a single segment
+        sorted by dashboard date
+        '''
+        with self._lock:
+            merged = self._empty()
+            for _, cols, rows, _ in self._sources():
+                for name, _ in COLUMNS:
+                    merged[name].frombytes(cols[name][:rows].tobytes())
+            if not len(merged['ts']):
+                return
+
+            old = self.segments
+            name = 'seg-{:08d}'.format(self._next_segment_number())
+            path = os.path.join(self.path, name)
+            _Segment.write(path, merged)
+            for seg in old:
+                seg.close()
+                shutil.rmtree(seg.path)
+            self.segments = [_Segment(path)]
+            self._buffer = self._empty()
+            self._latest = None
+            self._save_meta()
+
+    def close(self):
+        """Flush buffered rows and unmap all segments"""
+        with self._lock:
+            self.flush()
+            for seg in self.segments:
+                seg.close()
+            self.segments = []
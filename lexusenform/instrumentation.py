@@ -0,0 +1,208 @@
+"""Hooks for observing requests, token renewals and commands"""
+import bisect
+import threading
+from typing import Dict
+
+
+class Hooks:
+    """Base hook. Override whichever events are of interest"""
+
+    def on_request(self, host: str, endpoint: str, method: str, status: int,
+                   seconds: float, sent_bytes: int, received_bytes: int):
+        """An HTTP request finished. status is None if it raised"""
+        pass
+
+    def on_token(self, kind: str):
+        """A token was renewed. kind is 'refresh' or 'login'"""
+        pass
+
+    def on_retry(self, endpoint: str, attempt: int, reason: str):
+        """A command is about to be sent again"""
+        pass
+
+    def on_schedule(self, priority: str, seconds: float, queue_depth: int):
+        """A command waited seconds in the scheduler; queue_depth are still waiting"""
+        pass
+
+    def on_poll(self, namespace: str, progress: str):
+        """A command's progress was polled"""
+        pass
+
+    def on_command(self, namespace: str, seconds: float, polls: int,
+                   stages: Dict[str, float]):
+        """A command completed, with the seconds spent in each progress stage"""
+        pass
+
+
+class Instrumentation:
+    '''
+    Dispatches events to the attached hooks. Callers check
+    `if instrumentation.hooks` before measuring anything, so
+    there is no cost when nothing is attached.
+    '''
+
+    def __init__(self):
+        self.hooks = []
+
+    def add(self, hook: Hooks):
+        """Attach a hook"""
+        self.hooks = self.hooks + [hook]
+
+    def remove(self, hook: Hooks):
+        """Detach a hook"""
+        self.hooks = [h for h in self.hooks if h is not hook]
+
+    def request(self, *args):
+        for hook in self.hooks:
+            hook.on_request(*args)
+
+    def token(self, *args):
+        for hook in self.hooks:
+            hook.on_token(*args)
+
+    def retry(self, *args):
+        for hook in self.hooks:
+            hook.on_retry(*args)
+
+    def schedule(self, *args):
+        for hook in self.hooks:
+            hook.on_schedule(*args)
+
+    def poll(self, *args):
+        for hook in self.hooks:
+            hook.on_poll(*args)
+
+    def command(self, *args):
+        for hook in self.hooks:
+            hook.on_command(*args)
+
+
+class Histogram:
+    """Prometheus style cumulative histogram"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(names, values):
+    return ','.join('{}="{}"'.format(n, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                    for n, v in zip(names, values))
+
+
+class Metrics(Hooks):
+    '''
+    Aggregates every event into counters and histograms,
+    exportable in the Prometheus text format
+    '''
+    REQUEST_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    COMMAND_BUCKETS = (1, 2.5, 5, 10, 15, 20, 30, 45, 60, 90, 120, 180)
+
+    # name -> (type, help, label names)
+    METRICS = {
+        'lexusenform_requests_total':
+            ('counter', 'HTTP requests sent', ('host', 'endpoint', 'status')),
+        'lexusenform_request_sent_bytes_total':
+            ('counter', 'Request body bytes sent', ('host', 'endpoint')),
+        'lexusenform_request_received_bytes_total':
+            ('counter', 'Response body bytes received', ('host', 'endpoint')),
+        'lexusenform_request_seconds':
+            ('histogram', 'HTTP request latency', ('host', 'endpoint')),
+        'lexusenform_token_renewals_total':
+            ('counter', 'Id token refreshes and logins', ('kind',)),
+        'lexusenform_retries_total':
+            ('counter', 'Commands sent again after a failure', ('endpoint', 'reason')),
+        'lexusenform_scheduler_wait_seconds':
+            ('histogram', 'Time commands waited for the scheduler', ('priority',)),
+        'lexusenform_scheduler_queue_depth':
+            ('gauge', 'Commands waiting in the scheduler', ('priority',)),
+        'lexusenform_polls_total':
+            ('counter', 'Command progress polls', ('namespace', 'progress')),
+        'lexusenform_command_polls_total':
+            ('counter', 'Progress polls made by completed commands', ('namespace',)),
+        'lexusenform_command_seconds':
+            ('histogram', 'End-to-end command latency', ('namespace',)),
+        'lexusenform_command_stage_seconds':
+            ('histogram', 'Time commands spent in each progress stage', ('namespace', 'stage')),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.values = {name: {} for name in self.METRICS}
+
+    def _inc(self, name, labels, amount=1):
+        values = self.values[name]
+        values[labels] = values.get(labels, 0) + amount
+
+    def _observe(self, name, labels, value, buckets):
+        values = self.values[name]
+        hist = values.get(labels)
+        if hist is None:
+            hist = values[labels] = Histogram(buckets)
+        hist.observe(value)
+
+    def on_request(self, host, endpoint, method, status, seconds, sent_bytes, received_bytes):
+        with self._lock:
+            self._inc('lexusenform_requests_total', (host, endpoint, status or 'error'))
+            self._inc('lexusenform_request_sent_bytes_total', (host, endpoint), sent_bytes)
+            self._inc('lexusenform_request_received_bytes_total', (host, endpoint), received_bytes)
+            self._observe('lexusenform_request_seconds', (host, endpoint), seconds,
+                          self.REQUEST_BUCKETS)
+
+    def on_token(self, kind):
+        with self._lock:
+            self._inc('lexusenform_token_renewals_total', (kind,))
+
+    def on_retry(self, endpoint, attempt, reason):
+        with self._lock:
+            self._inc('lexusenform_retries_total', (endpoint, reason))
+
+    def on_schedule(self, priority, seconds, queue_depth):
+        with self._lock:
+            self._observe('lexusenform_scheduler_wait_seconds', (priority,), seconds,
+                          self.REQUEST_BUCKETS)
+            self.values['lexusenform_scheduler_queue_depth'][(priority,)] = queue_depth
+
+    def on_poll(self, namespace, progress):
+        with self._lock:
+            self._inc('lexusenform_polls_total', (namespace, progress))
+
+    def on_command(self, namespace, seconds, polls, stages):
+        with self._lock:
+            self._inc('lexusenform_command_polls_total', (namespace,), polls)
+            self._observe('lexusenform_command_seconds', (namespace,), seconds,
+                          self.COMMAND_BUCKETS)
+            for stage, stage_seconds in stages.items():
+                self._observe('lexusenform_command_stage_seconds', (namespace, stage),
+                              stage_seconds, self.COMMAND_BUCKETS)
+
+    def to_prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, (kind, text, label_names) in self.METRICS.items():
+                values = self.values[name]
+                if not values:
+                    continue
+                lines.append('# HELP {} {}'.format(name, text))
+                lines.append('# TYPE {} {}'.format(name, kind))
+                for labels, value in sorted(values.items(), key=lambda i: str(i[0])):
+                    label_text = _labels(label_names, labels)
+                    if kind != 'histogram':
+                        lines.append('{}{{{}}} {}'.format(name, label_text, value))
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(list(value.buckets) + ['+Inf'], value.counts):
+                        cumulative += count
+                        lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                            name, label_text, bound, cumulative))
+                    lines.append('{}_sum{{{}}} {}'.format(name, label_text, value.sum))
+                    lines.append('{}_count{{{}}} {}'.format(name, label_text, value.count))
+        return '\n'.join(lines) + '\n'
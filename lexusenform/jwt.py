@@ -11,6 +11,10 @@ def token_is_expired(token: str) -> bool:
 
     return time.time() > parsed['exp']
 
+def token_expiry(token: str) -> float:
+    """Get the expiry time of a JWT token, in seconds since the epoch"""
+    return parse_jwt_claims(token)['exp']
+
 def parse_jwt_claims(token: str) -> Dict:
     """Parse the claims section from a JWT"""
     parts = token.split('.')
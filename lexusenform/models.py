@@ -4,12 +4,31 @@ from enum import Enum
 from typing import Tuple, List, Dict
 
 
+# Fixed order of every component in a VehicleStatus, used
+# wherever component flags are packed into bitsets
+COMPONENT_SLOTS = (
+    ('doors', 'driver'),
+    ('doors', 'passenger'),
+    ('doors', 'rear_passenger'),
+    ('doors', 'rear_driver'),
+    ('windows', 'driver'),
+    ('windows', 'passenger'),
+    ('windows', 'rear_passenger'),
+    ('windows', 'rear_driver'),
+    ('other', 'hood'),
+    ('other', 'trunk'),
+    ('other', 'sunroof'),
+)
+
+
 def strike_if_not(text, b):
     if b:
         return text
     return text.replace('', '\u0336')[:-1]
 
 class Component:
+    __slots__ = ('name', 'closed', 'locked', 'safe')
+
     def __init__(self, name: str):
         self.name = name
         self.closed = None
@@ -26,6 +45,10 @@ class Component:
 
 class VehicleStatus:
     '''Details on a vehicle's status'''
+    __slots__ = ('last_updated_date', 'dashboard_date', 'odometer', 'fuel_gauge',
+                 'drive_range', 'trip_a', 'trip_b', 'hazards_on', 'doors',
+                 'windows', 'other')
+
     def __init__(self,
                  last_updated_date: datetime,
                  dashboard_date: datetime,
@@ -88,6 +111,8 @@ class CommandStatus(Enum):
 
 class BasicCommandResponse:
     '''Response details from a command request'''
+    __slots__ = ('code', 'status', 'timestamp')
+
     def __init__(self, code: str, timestamp: datetime = None):
         self.code = code
         if code == '011000':
@@ -104,7 +129,12 @@ class ProgressStatus(Enum):
     UNKNOWN = 4
 
 class ProgressResponse:
-    '''Progress of a sent command'''
+    '''
+    Progress of a sent command. The raw response text is only
+    kept when the parser was asked to retain it.
+    '''
+    __slots__ = ('code', 'vehicle_code', 'timestamp', 'location', 'status',
+                 'action', 'progress', 'command_status', 'response_text')
 
     OK_STATUS = ['SmsSent', 'WaitingDcmRequest', 'OnDcmExecuting']
     FAILED_CODE = ['211018']
@@ -129,3 +159,18 @@ class ProgressResponse:
         else:
             self.command_status = ProgressStatus.UNKNOWN
         self.response_text = response_text
+
+
+class PlanResult:
+    '''
+    Result of a vehicle plan. status and location are None when the
+    plan did not ask for them; refreshed is whether the vehicle was
+    asked for a fresh status first.
+    '''
+    __slots__ = ('status', 'location', 'refreshed')
+
+    def __init__(self, status: VehicleStatus = None, location: tuple = None,
+                 refreshed: bool = False):
+        self.status = status
+        self.location = location
+        self.refreshed = refreshed
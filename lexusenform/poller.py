@@ -0,0 +1,149 @@
+"""Progress polling shared between everyone waiting on the same command"""
+import functools
+import queue
+import threading
+import time
+
+from .commands import Commands as c
+from .models import ProgressStatus
+from .polling import ProgressTracker
+from .vehicle import progress_finished, print_progress
+from . import AccountError
+from . import deadline
+
+# Put on a waiter's queue when its deadline is cancelled
+_WAKE = object()
+
+
+def _poll_error(namespace, cause):
+    '''A separate error for each waiter, so they do not share a traceback'''
+    err = AccountError("Polling progress of {} failed: {}".format(namespace, cause))
+    err.__cause__ = cause
+    return err
+
+
+class _PollLoop:
+    """Background poll of one (VIN, namespace), fanned out to its waiters"""
+
+    def __init__(self, poller, key, token):
+        self.poller = poller
+        self.key = key
+        self.token = token
+        self.waiters = set()
+        self.idle = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True,
+                                       name='progress-{}-{}'.format(*key))
+
+    def run(self):
+        account = self.poller.account
+        vin, namespace = self.key
+        tracker = ProgressTracker(account.polling, namespace, account.instrumentation)
+        failures = 0
+        while True:
+            with self.poller.lock:
+                if not self.waiters:
+                    del self.poller.loops[self.key]
+                    return
+                targets = list(self.waiters)
+                prog_c = c.command_progress(self.token, vin, namespace, polling=True)
+
+            try:
+                prog = account.execute(prog_c)
+            except Exception as ex:  # pylint: disable=W0703
+                # execute has already retried; only give up on the
+                # waiters if the next polls fail as well
+                failures += 1
+                if failures >= self.poller.FAILURES:
+                    failures = 0
+                    for waiter in targets:
+                        waiter.put(_poll_error(namespace, ex))
+                self.idle.wait(tracker.strategy.next_interval(namespace, None, 0, 0))
+                continue
+            failures = 0
+
+            if account.DEBUG:
+                print_progress(prog)
+            for waiter in targets:
+                waiter.put(prog)
+            if prog.command_status == ProgressStatus.COMPLETED:
+                tracker.finish(prog)
+                tracker = ProgressTracker(account.polling, namespace, account.instrumentation)
+                self.idle.wait(tracker.strategy.next_interval(namespace, None, 0, 0))
+                continue
+            self.idle.wait(tracker.update(prog))
+
+
+class ProgressPoller:
+    '''
+    Polls command progress once per interval for each distinct
+    (VIN, namespace) and hands every response to all threads
+    waiting on it, so upstream requests scale with in-flight
+    commands rather than with callers. Waiters fail only after
+    FAILURES polls in a row have failed.
+    '''
+    FAILURES = 3
+
+    def __init__(self, account):
+        self.account = account
+        self.lock = threading.Lock()
+        self.loops = {}
+
+    def _subscribe(self, vin, namespace, token):
+        waiter = queue.Queue()
+        key = (vin, namespace)
+        with self.lock:
+            loop = self.loops.get(key)
+            start = loop is None
+            if start:
+                loop = _PollLoop(self, key, token)
+                self.loops[key] = loop
+            loop.token = token
+            loop.waiters.add(waiter)
+            loop.idle.clear()
+        if start:
+            loop.thread.start()
+        return loop, waiter
+
+    def _unsubscribe(self, loop, waiter):
+        with self.lock:
+            loop.waiters.discard(waiter)
+            if not loop.waiters:
+                loop.idle.set()
+
+    def wait(self, vin: str, namespace: str, token: str,
+             vehicle_code: str = None, timeout: float = 180):
+        '''
+        Block until the command in namespace finishes, optionally
+        with the given vehicle code, and return its final progress
+        '''
+        expires = time.time() + timeout
+        limit = deadline.current()
+        what = 'Command {}'.format(namespace)
+        loop, waiter = self._subscribe(vin, namespace, token)
+        wake = functools.partial(waiter.put, _WAKE)
+        if limit is not None:
+            limit.on_cancel(wake)
+        try:
+            while True:
+                remaining = expires - time.time()
+                if limit is not None:
+                    limit.check(what)
+                    remaining = limit.timeout(remaining)
+                if remaining <= 0:
+                    raise AccountError("Command timed out without completing")
+                try:
+                    prog = waiter.get(timeout=remaining)
+                except queue.Empty:
+                    if limit is not None:
+                        limit.check(what)
+                    raise AccountError("Command timed out without completing")
+                if prog is _WAKE:
+                    continue
+                if isinstance(prog, Exception):
+                    raise prog
+                if progress_finished(prog, vehicle_code):
+                    return prog
+        finally:
+            if limit is not None:
+                limit.remove_callback(wake)
+            self._unsubscribe(loop, waiter)
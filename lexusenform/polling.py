@@ -0,0 +1,215 @@
+"""Strategies for how often to poll command progress"""
+import bisect
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from typing import Dict
+
+
+class PollingStrategy:
+    """Decides how long to wait before the next progress poll"""
+
+    def next_interval(self, namespace: str, stage: str,
+                      stage_elapsed: float, polls_in_stage: int) -> float:
+        """Implement in subclass"""
+        raise NotImplementedError()
+
+    def record(self, namespace: str, durations: Dict[str, float]):
+        """Learn from how long each stage of a finished command took"""
+        pass
+
+
+class FixedPolling(PollingStrategy):
+    """Poll at a fixed interval, regardless of stage"""
+
+    def __init__(self, interval: float = 5):
+        self.interval = interval
+
+    def next_interval(self, namespace, stage, stage_elapsed, polls_in_stage):
+        return self.interval
+
+
+class LatencyHistogram:
+    """Counts of observed stage durations, in seconds"""
+    BOUNDS = [0.5, 1, 2, 3, 4, 5, 7, 10, 15, 20, 30, 45, 60, 90, 120, 180, float('inf')]
+
+    def __init__(self, counts=None):
+        self.counts = list(counts) if counts else [0] * len(self.BOUNDS)
+
+    @property
+    def total(self):
+        return sum(self.counts)
+
+    def add(self, seconds: float):
+        """Record one observed duration"""
+        self.counts[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+
+    def quantile_after(self, elapsed: float, q: float = 0.5) -> float:
+        '''
+        Estimate the q-th quantile of the duration, given it has
+        already lasted for elapsed seconds. None if nothing is known.
+        '''
+        start = bisect.bisect_left(self.BOUNDS, elapsed)
+        remaining = self.counts[start:]
+        mass = sum(remaining)
+        if not mass:
+            return None
+        seen = 0
+        for idx, count in enumerate(remaining):
+            seen += count
+            if seen >= q * mass:
+                return self.BOUNDS[start + idx]
+        return self.BOUNDS[-1]
+
+
+class AdaptivePolling(PollingStrategy):
+    '''
+    Picks the next interval from the current progress stage and
+    namespace. Once enough commands have been observed, it waits
+    until the stage is most likely to have finished; before that,
+    it uses per-stage defaults with backoff. Every interval is
+    jittered so many vehicles do not poll in lockstep.
+    Histograms are persisted to path, if given, at most every
+    save_interval seconds.
+    '''
+    # Initial poll interval for each stage; None is before the first poll.
+    # Short, so a cold start notices a quick stage well before the old
+    # fixed 5s polling would; backoff stretches them for slow stages
+    DEFAULT_INTERVALS = {
+        None: 2,
+        'SmsSent': 2,
+        'WaitingDcmRequest': 2,
+        'OnDcmExecuting': 1.5,
+    }
+    DEFAULT_INTERVAL = 5
+    BACKOFF = 1.5
+    # Backoff never waits longer than this without a histogram, so a
+    # stage is noticed no later than with the old fixed 5s polling
+    MAX_BACKOFF_INTERVAL = 5
+    MIN_INTERVAL = 1
+    MAX_INTERVAL = 15
+    MIN_SAMPLES = 5
+    JITTER = 0.2
+    SAVE_INTERVAL = 30
+
+    def __init__(self, path: str = None, jitter: float = None, save_interval: float = None):
+        self.path = path
+        self.jitter = self.JITTER if jitter is None else jitter
+        self.save_interval = self.SAVE_INTERVAL if save_interval is None else save_interval
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._saved_at = 0
+        if path:
+            self.load()
+
+    def _key(self, namespace, stage):
+        return '{}/{}'.format(namespace, stage)
+
+    def next_interval(self, namespace, stage, stage_elapsed, polls_in_stage):
+        interval = None
+        hist = self.histograms.get(self._key(namespace, stage))
+        if hist is not None and hist.total >= self.MIN_SAMPLES:
+            expected = hist.quantile_after(stage_elapsed)
+            if expected is not None and expected != float('inf'):
+                interval = expected - stage_elapsed
+        if interval is None:
+            default = self.DEFAULT_INTERVALS.get(stage, self.DEFAULT_INTERVAL)
+            interval = min(default * self.BACKOFF ** polls_in_stage,
+                           max(default, self.MAX_BACKOFF_INTERVAL))
+
+        interval *= 1 + random.uniform(-self.jitter, self.jitter)
+        return min(self.MAX_INTERVAL, max(self.MIN_INTERVAL, interval))
+
+    def record(self, namespace, durations):
+        with self._lock:
+            for stage, seconds in durations.items():
+                key = self._key(namespace, stage)
+                if key not in self.histograms:
+                    self.histograms[key] = LatencyHistogram()
+                self.histograms[key].add(seconds)
+            due = self.path and time.time() - self._saved_at >= self.save_interval
+        if due:
+            self.save()
+
+    def load(self):
+        """Load histograms from the path, if it exists"""
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            return
+        self.histograms = {k: LatencyHistogram(v) for k, v in data.items()}
+
+    def save(self):
+        '''
+        Persist histograms to the path. The file is replaced
+        atomically, so readers never see a partial write.
+        '''
+        with self._save_lock:
+            with self._lock:
+                data = {k: list(h.counts) for k, h in self.histograms.items()}
+                self._saved_at = time.time()
+            directory = os.path.dirname(os.path.abspath(self.path))
+            try:
+                fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp', suffix='.json')
+            except IOError:
+                return
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(data, f)
+                os.replace(tmp, self.path)
+            except IOError:
+                os.unlink(tmp)
+
+
+class ProgressTracker:
+    '''
+    Follows the stages of a single command as it is polled,
+    asking the strategy for each interval and reporting stage
+    durations back to it when the command completes.
+    '''
+
+    def __init__(self, strategy: PollingStrategy, namespace: str, instrumentation=None):
+        self.strategy = strategy
+        self.namespace = namespace
+        self.instrumentation = instrumentation
+        self.stage = None
+        self.started = self.stage_started = time.time()
+        self.polls = 0
+        self.polls_in_stage = 0
+        self.durations = {}
+
+    def _polled(self, prog):
+        self.polls += 1
+        if self.instrumentation is not None and self.instrumentation.hooks:
+            self.instrumentation.poll(self.namespace, prog.progress)
+
+    def update(self, prog) -> float:
+        """Note a new progress response and return the seconds until the next poll"""
+        self._polled(prog)
+        now = time.time()
+        if prog.progress != self.stage:
+            self.durations[self.stage] = now - self.stage_started
+            self.stage = prog.progress
+            self.stage_started = now
+            self.polls_in_stage = 0
+        interval = self.strategy.next_interval(
+            self.namespace, self.stage, now - self.stage_started, self.polls_in_stage)
+        self.polls_in_stage += 1
+        return interval
+
+    def finish(self, prog):
+        """Report the stage durations of a completed command"""
+        self._polled(prog)
+        now = time.time()
+        if prog.progress != self.stage:
+            self.durations[self.stage] = now - self.stage_started
+        self.durations.pop(None, None)
+        self.strategy.record(self.namespace, self.durations)
+        if self.instrumentation is not None and self.instrumentation.hooks:
+            self.instrumentation.command(self.namespace, now - self.started,
+                                         self.polls, self.durations)
@@ -0,0 +1,143 @@
+"""Many accounts, logged in together"""
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+from .account import Account
+from .fleet import BatchExecutor
+from .transport import SessionTransport
+
+
+class AccountPool:
+    '''
+    A set of accounts whose tokens are renewed in parallel, with
+    bounded concurrency, ahead of their first command. Accounts
+    with a valid cached id token are ready at once; those with a
+    valid refresh token are refreshed; only the rest log in.
+    '''
+    MAX_WORKERS = 8
+
+    PENDING = 'pending'
+    READY = 'ready'
+    FAILED = 'failed'
+
+    def __init__(self, accounts: Iterable[Account] = (), max_workers: int = None):
+        self.accounts = {}
+        self.max_workers = max_workers or self.MAX_WORKERS
+        self.states = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+        self._running = set()
+        self._batches = 0
+        self._done = threading.Event()
+        self._done.set()
+        for account in accounts:
+            self.add(account)
+
+    @classmethod
+    def from_credentials(cls, credentials: Iterable[Tuple[str, str, str]],
+                         max_workers: int = None, account_class=Account,
+                         **kwargs) -> 'AccountPool':
+        '''
+        Build a pool from (email, password, config_file) tuples.
+        Unless a transport is given, each account gets a session of
+        its own over one shared set of connection pools. Other
+        keyword arguments are passed to each account.
+        '''
+        transport = kwargs.pop('transport', None)
+        shared = SessionTransport.shared() if transport is None else None
+        return cls([account_class(email, password, config_file,
+                                  transport=transport or shared.sibling(), **kwargs)
+                    for email, password, config_file in credentials], max_workers)
+
+    def add(self, account: Account):
+        """Add an account. It is not logged in until the next start()"""
+        with self._lock:
+            self.accounts[account.email] = account
+            self.states[account.email] = self.PENDING
+
+    def __getitem__(self, email: str) -> Account:
+        return self.accounts[email]
+
+    def __iter__(self):
+        return iter(self.accounts.values())
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def _warm(self, account: Account):
+        account.get_id_token()
+
+    def _run(self, accounts, connect):
+        if connect:
+            # the hosts are the same for every account, so only
+            # one account per transport needs to open connections
+            seen = set()
+            for account in accounts:
+                if id(account.transport) not in seen:
+                    seen.add(id(account.transport))
+                    account.warm_up()
+        try:
+            for result in BatchExecutor(self.max_workers).as_completed(accounts, self._warm):
+                email = result.item.email
+                with self._lock:
+                    self._running.discard(email)
+                    if result.ok:
+                        self.states[email] = self.READY
+                        self.errors.pop(email, None)
+                    else:
+                        self.states[email] = self.FAILED
+                        self.errors[email] = result.error
+        finally:
+            with self._lock:
+                for account in accounts:
+                    self._running.discard(account.email)
+                self._batches -= 1
+                if not self._batches:
+                    self._done.set()
+
+    def start(self, connect: bool = True, wait: bool = False) -> 'AccountPool':
+        '''
+        Renew the tokens of every account that is not ready, in the
+        background. Accounts still being renewed by an earlier
+        start() are left to it. With connect, connections to the
+        service are opened first. With wait, block until every
+        account is done.
+        '''
+        with self._lock:
+            accounts = [a for a in self.accounts.values()
+                        if self.states[a.email] != self.READY
+                        and a.email not in self._running]
+            for account in accounts:
+                self.states[account.email] = self.PENDING
+                self._running.add(account.email)
+            if accounts:
+                self._batches += 1
+                self._done.clear()
+        if accounts:
+            thread = threading.Thread(target=self._run, args=(accounts, connect),
+                                      daemon=True, name='account-pool')
+            thread.start()
+        if wait:
+            self._done.wait()
+        return self
+
+    def wait(self, timeout: float = None) -> bool:
+        """Block until every start() has finished. False on timeout"""
+        return self._done.wait(timeout)
+
+    @property
+    def ready(self) -> bool:
+        """True once every account is logged in"""
+        with self._lock:
+            return all(state == self.READY for state in self.states.values())
+
+    def readiness(self) -> Dict[str, str]:
+        """State of every account, keyed by email"""
+        with self._lock:
+            return dict(self.states)
+
+    def ready_accounts(self) -> List[Account]:
+        """Accounts that are logged in"""
+        with self._lock:
+            return [self.accounts[email] for email, state in self.states.items()
+                    if state == self.READY]
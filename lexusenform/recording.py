@@ -0,0 +1,256 @@
+"""Recording traffic to an archive and replaying it without a network"""
+import base64
+import hashlib
+import json
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, Iterator
+from urllib.parse import urlencode, urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from .transport import Transport, SessionTransport
+from . import AccountError
+
+# The id token inside command bodies differs on every run
+_AUTH = re.compile(rb'<AUTH REGION="US">[^<]*</AUTH>')
+
+
+def _body_bytes(data) -> bytes:
+    if data is None:
+        return b''
+    if isinstance(data, dict):
+        return urlencode(sorted(data.items())).encode('utf-8')
+    if isinstance(data, str):
+        return data.encode('utf-8')
+    return bytes(data)
+
+
+def request_key(method: str, url: str, params=None, data=None) -> bytes:
+    '''
+    Digest identifying a request regardless of host and id token,
+    so replays match across environments and sessions
+    '''
+    query = sorted((params or {}).items())
+    body = _AUTH.sub(b'<AUTH REGION="US" />', _body_bytes(data))
+    text = json.dumps([method, urlsplit(url).path, query, body.decode('latin-1')])
+    return hashlib.sha1(text.encode('utf-8')).digest()[:16]
+
+
+def _encode(content: bytes) -> str:
+    return base64.b64encode(content).decode('ascii')
+
+
+def record_content(record: Dict, field: str = 'response') -> bytes:
+    '''
+    The exact bytes of a record's response, or of its request with
+    field='body'. Both are stored base64 encoded, so bodies in any
+    encoding replay unchanged.
+    '''
+    return base64.b64decode(record[field])
+
+
+def record_text(record: Dict, field: str = 'response') -> str:
+    '''
+    A record's response (or request body) as text, decoded with the
+    charset its recorded Content-Type declares, or UTF-8
+    '''
+    encoding = 'utf-8'
+    if field == 'response':
+        headers = CaseInsensitiveDict(record['headers'])
+        encoding = requests.utils.get_encoding_from_headers(headers) or encoding
+    return record_content(record, field).decode(encoding, 'replace')
+
+
+class TrafficArchive:
+    '''
+    Append-only archive of requests and their responses. Each
+    record is a length-prefixed, zlib compressed JSON document in
+    the data file; a fixed-size entry per record in path + '.idx'
+    holds its offset, length, request key and time. A record only
+    counts once its index entry is written, so a torn write at the
+    end is ignored.
+    '''
+    INDEX_ENTRY = struct.Struct('<QI16sd')
+    LENGTH = struct.Struct('<I')
+    # Never stored, since they carry credentials
+    SKIP_HEADERS = ('set-cookie',)
+    # Stored as REDACTED. The account GUID is also replaced in paths,
+    # so the replayed exchange leads to the recorded vehicles request
+    REDACT_HEADERS = ('cv-apikey', 'guid')
+    REDACT_FIELDS = ('access_token', 'id_token', 'refresh_token')
+    REDACTED = 'redacted'
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index_path = path + '.idx'
+        self._lock = threading.Lock()
+        self.entries = []
+        self.by_key = {}
+        self._secrets = set()
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'rb') as f:
+                data = f.read()
+            usable = len(data) - len(data) % self.INDEX_ENTRY.size
+            for entry in self.INDEX_ENTRY.iter_unpack(data[:usable]):
+                self._add_entry(entry)
+        self._data = open(path, 'ab')
+        self._index = open(self.index_path, 'ab')
+        if os.path.exists(self.index_path):
+            self._index.truncate(len(self.entries) * self.INDEX_ENTRY.size)
+
+    def _add_entry(self, entry):
+        self.by_key.setdefault(entry[2], []).append(len(self.entries))
+        self.entries.append(entry)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _redact_headers(self, response):
+        headers = {}
+        for name, value in response.headers.items():
+            lower = name.lower()
+            if lower in self.SKIP_HEADERS:
+                continue
+            if lower in self.REDACT_HEADERS:
+                if value:
+                    self._secrets.add(value)
+                value = self.REDACTED
+            headers[name] = value
+        return headers
+
+    def _redact_content(self, content: bytes) -> bytes:
+        if not content.lstrip().startswith(b'{'):
+            return content
+        try:
+            body = json.loads(content)
+        except ValueError:
+            return content
+        if not isinstance(body, dict) or not any(field in body for field in self.REDACT_FIELDS):
+            return content
+        for field in self.REDACT_FIELDS:
+            if field in body:
+                body[field] = self.REDACTED
+        return json.dumps(body).encode('utf-8')
+
+    def append(self, method: str, url: str, params, data, response: requests.Response):
+        '''
+        Record one request and the response it got, with tokens,
+        API keys and the account GUID replaced by REDACTED
+        '''
+        with self._lock:
+            headers = self._redact_headers(response)
+            for secret in self._secrets:
+                url = url.replace(secret, self.REDACTED)
+        record = {
+            'method': method,
+            'path': urlsplit(url).path,
+            'query': params or {},
+            'body': _encode(_AUTH.sub(b'<AUTH REGION="US" />', _body_bytes(data))),
+            'status': response.status_code,
+            'headers': headers,
+            'response': _encode(self._redact_content(response.content)),
+            'seconds': response.elapsed.total_seconds() if response.elapsed else None,
+        }
+        payload = zlib.compress(json.dumps(record).encode('utf-8'))
+        key = request_key(method, url, params, data)
+        with self._lock:
+            offset = self._data.seek(0, os.SEEK_END)
+            self._data.write(self.LENGTH.pack(len(payload)) + payload)
+            self._data.flush()
+            entry = (offset, len(payload), key, time.time())
+            self._index.write(self.INDEX_ENTRY.pack(*entry))
+            self._index.flush()
+            self._add_entry(entry)
+
+    def read(self, number: int) -> Dict:
+        """The record with the given position in the archive"""
+        offset, length = self.entries[number][:2]
+        with open(self.path, 'rb') as f:
+            f.seek(offset + self.LENGTH.size)
+            return json.loads(zlib.decompress(f.read(length)).decode('utf-8'))
+
+    def records(self) -> Iterator[Dict]:
+        """Every record, in the order it was recorded"""
+        with open(self.path, 'rb') as f:
+            for offset, length, _, _ in list(self.entries):
+                f.seek(offset + self.LENGTH.size)
+                yield json.loads(zlib.decompress(f.read(length)).decode('utf-8'))
+
+    def close(self):
+        self._data.close()
+        self._index.close()
+
+
+class RecordingTransport(Transport):
+    '''
+    Sends requests through another transport and records them in a
+    TrafficArchive. The login flow, which runs in its own session,
+    and token requests are not recorded; neither are request headers,
+    and credentials in responses are redacted.
+    '''
+    SKIP_PATHS = ('/oauth2/',)
+
+    def __init__(self, archive: TrafficArchive, transport: Transport = None):
+        self.archive = archive
+        self.transport = transport or SessionTransport()
+
+    def request(self, method, url, session=None, **kwargs):
+        resp = self.transport.request(method, url, session=session, **kwargs)
+        if session is None and not any(p in url for p in self.SKIP_PATHS):
+            self.archive.append(method, url, kwargs.get('params'), kwargs.get('data'), resp)
+        return resp
+
+    def new_session(self):
+        return self.transport.new_session()
+
+    def warm_up(self, urls, timeout=10):
+        return self.transport.warm_up(urls, timeout)
+
+    def close(self):
+        self.transport.close()
+
+
+class ReplayTransport(Transport):
+    '''
+    Answers requests from a TrafficArchive, with no network access.
+    Repeated requests get the recorded responses in order, then keep
+    getting the last one, so progress polls replay each stage.
+    Logging in cannot be replayed: use a config with a cached token.
+    '''
+
+    def __init__(self, archive: TrafficArchive):
+        self.archive = archive
+        self._served = {}
+        self._lock = threading.Lock()
+
+    def request(self, method, url, session=None, **kwargs):
+        params, data = kwargs.get('params'), kwargs.get('data')
+        key = request_key(method, url, params, data)
+        numbers = self.archive.by_key.get(key)
+        if not numbers:
+            raise AccountError("No recorded response for {} {}".format(method, urlsplit(url).path))
+        with self._lock:
+            served = self._served.get(key, 0)
+            self._served[key] = served + 1
+        record = self.archive.read(numbers[min(served, len(numbers) - 1)])
+
+        resp = requests.Response()
+        resp.status_code = record['status']
+        resp._content = record_content(record)  # pylint: disable=W0212
+        resp.headers = CaseInsensitiveDict(record['headers'])
+        resp.url = url
+        resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+        resp.request = requests.Request(method, url, params=params, data=data,
+                                        headers=kwargs.get('headers')).prepare()
+        return resp
+
+    def reset(self):
+        """Serve every recorded sequence from its start again"""
+        with self._lock:
+            self._served.clear()
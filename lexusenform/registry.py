@@ -0,0 +1,134 @@
+"""Index of the vehicles on an account"""
+from typing import Dict, Iterable, List
+
+from .vehicle import Vehicle
+
+
+class VehicleRegistry:
+    '''
+    The vehicles on an account, indexed by vehicle id, full VIN
+    and partial VIN. Partial VINs are kept in one dict per prefix
+    length, so resolving a VIN costs a dict lookup per distinct
+    length, longest first, instead of a scan of every vehicle.
+    '''
+
+    def __init__(self, vehicles: Iterable[Vehicle] = ()):
+        self.vehicles = []
+        self.by_id = {}
+        self.by_vin = {}
+        self._by_prefix = {}
+        self._lengths = []
+        for veh in vehicles:
+            self._add(veh)
+
+    def __iter__(self):
+        return iter(self.vehicles)
+
+    def __len__(self):
+        return len(self.vehicles)
+
+    def _index(self, veh):
+        self.by_id[veh.vehicle_id] = veh
+        if veh.full_vin:
+            self.by_vin[veh.full_vin] = veh
+        if veh.partial_vin is not None:
+            length = len(veh.partial_vin)
+            if length not in self._by_prefix:
+                self._by_prefix[length] = {}
+                self._lengths = sorted(self._by_prefix, reverse=True)
+            # the first vehicle with a given partial VIN wins, as in a scan
+            self._by_prefix[length].setdefault(veh.partial_vin, veh)
+
+    def _unindex(self, veh):
+        self.by_id.pop(veh.vehicle_id, None)
+        if veh.full_vin and self.by_vin.get(veh.full_vin) is veh:
+            del self.by_vin[veh.full_vin]
+        if veh.partial_vin is not None:
+            prefixes = self._by_prefix.get(len(veh.partial_vin), {})
+            if prefixes.get(veh.partial_vin) is veh:
+                del prefixes[veh.partial_vin]
+                for other in self.vehicles:
+                    if other is not veh and other.partial_vin == veh.partial_vin:
+                        prefixes[veh.partial_vin] = other
+                        break
+            if not prefixes and len(veh.partial_vin) in self._by_prefix:
+                del self._by_prefix[len(veh.partial_vin)]
+                self._lengths = sorted(self._by_prefix, reverse=True)
+
+    def _add(self, veh):
+        self.vehicles.append(veh)
+        self._index(veh)
+
+    def get(self, vehicle_id) -> Vehicle:
+        """The vehicle with the given id, or None"""
+        return self.by_id.get(vehicle_id)
+
+    def find(self, vin: str) -> Vehicle:
+        """The vehicle with the given full VIN, or whose partial VIN it starts with"""
+        veh = self.by_vin.get(vin)
+        if veh is not None:
+            return veh
+        for length in self._lengths:
+            veh = self._by_prefix[length].get(vin[:length])
+            if veh is not None:
+                return veh
+        return None
+
+    def set_full_vin(self, veh: Vehicle, vin: str):
+        """Set a vehicle's full VIN, keeping the index up to date"""
+        if veh.full_vin and self.by_vin.get(veh.full_vin) is veh:
+            del self.by_vin[veh.full_vin]
+        veh.full_vin = vin
+        if vin:
+            self.by_vin[vin] = veh
+
+    def apply_mappings(self, mappings: Dict[str, str]) -> bool:
+        """Fill in missing full VINs from vehicle id -> VIN mappings. True if any changed"""
+        changed = False
+        for vehicle_id, vin in mappings.items():
+            veh = self.by_id.get(vehicle_id)
+            if veh is not None and veh.full_vin is None and vin:
+                self.set_full_vin(veh, vin)
+                changed = True
+        return changed
+
+    def update(self, items: List[Dict], mappings: Dict[str, str], account=None) -> bool:
+        '''
+        Bring the registry in line with a vehicle list from the
+        subscription service. Known vehicles are updated in place,
+        new ones are added and missing ones are dropped.
+        Returns True if anything changed.
+        '''
+        changed = False
+        seen = set()
+        for item in items:
+            vehicle_id = item['id']
+            seen.add(vehicle_id)
+            fields = (item['vin'], item['makeName'], item['modelName'], item['modelYear'])
+            veh = self.by_id.get(vehicle_id)
+            if veh is None:
+                veh = Vehicle(vehicle_id, item['vin'], mappings.get(vehicle_id),
+                              item['makeName'], item['modelName'], item['modelYear'],
+                              extra_data=item)
+                veh.set_account(account)
+                self._add(veh)
+                changed = True
+                continue
+            if (veh.partial_vin, veh.make, veh.model, veh.year) != fields:
+                self._unindex(veh)
+                veh.partial_vin, veh.make, veh.model, veh.year = fields
+                self._index(veh)
+                changed = True
+            if veh.extra_data != item:
+                veh.extra_data = item
+                changed = True
+            if veh.full_vin is None and mappings.get(vehicle_id):
+                self.set_full_vin(veh, mappings[vehicle_id])
+                changed = True
+
+        removed = [veh for veh in self.vehicles if veh.vehicle_id not in seen]
+        for veh in removed:
+            self.vehicles.remove(veh)
+            self._unindex(veh)
+            changed = True
+        return changed
@@ -1,6 +1,6 @@
 """Various response parsers"""
 
 from .common import ResponseParser, DummyParser
-from .status_parser import StatusParser
+from .status_parser import StatusParser, StatusRowParser
 from .basic_command_response_parser import BasicCommandResponseParser
 from .progress_parser import ProgressParser
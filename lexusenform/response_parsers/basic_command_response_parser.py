@@ -1,7 +1,5 @@
-import dateutil.parser as dp
-
 from .. import models as m
-from ..timezone import TIMEZONE_MAPPING as tz
+from ..timestamps import parse_timestamp
 from .common import ResponseParser
 
 class BasicCommandResponseParser(ResponseParser):
@@ -12,6 +10,6 @@ class BasicCommandResponseParser(ResponseParser):
         date_elem = self.root.find("RESULT/DATETIME")
         timestamp = None
         if date_elem is not None:
-            timestamp = dp.parse(date_elem.text, tzinfos=tz)
+            timestamp = parse_timestamp(date_elem.text)
 
         return m.BasicCommandResponse(code, timestamp)
@@ -2,9 +2,12 @@ from xml.etree import ElementTree as et
 
 
 class ResponseParser:
-    """Base response parser"""
-    def __init__(self, text, namespace = None):
-        self.response_text = text
+    '''
+    Base response parser. The raw text is only retained,
+    e.g. for debugging, when keep_raw is set.
+    '''
+    def __init__(self, text, namespace = None, keep_raw = False):
+        self.response_text = text if keep_raw else None
         self.root = et.fromstring(text)
         self.namespace = namespace
 
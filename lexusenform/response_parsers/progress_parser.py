@@ -1,7 +1,5 @@
-import dateutil.parser as dp
-
 from .. import models as m
-from ..timezone import TIMEZONE_MAPPING as tz
+from ..timestamps import parse_timestamp
 from .common import ResponseParser
 
 class ProgressParser(ResponseParser):
@@ -20,7 +18,7 @@ class ProgressParser(ResponseParser):
         timestamp = None
         ts_elem = self.root.find(self.namespace + "/DATE")
         if ts_elem is not None:
-            timestamp = dp.parse(ts_elem.text, tzinfos=tz)
+            timestamp = parse_timestamp(ts_elem.text)
 
         lat = None
         lat_elem = self.root.find("LAT")
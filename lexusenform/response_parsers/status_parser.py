@@ -1,126 +1,170 @@
-import dateutil.parser as dp
-
 from .. import models as m
-from ..timezone import TIMEZONE_MAPPING as tz
+from ..timestamps import epoch_seconds, parse_timestamp
 from .common import ResponseParser
 
+# TYPE code -> VehicleStatus measurement, parsed as (float(DATA), UNIT)
+MEASUREMENTS = {
+    'ODO': 'odometer',
+    'FUGAGE': 'fuel_gauge',
+    'RAGE': 'drive_range',
+    'TRIPA': 'trip_a',
+    'TRIPB': 'trip_b',
+}
+
+# TYPE code -> (component group, key, attribute, DATA value meaning True,
+#               key of the component whose safe flag is combined)
+COMPONENTS = {
+    'DCTY': ('doors', 'driver', 'closed', 'close', 'driver'),
+    'RLCY': ('doors', 'rear_driver', 'closed', 'close', 'rear_driver'),
+    'PCTY': ('doors', 'passenger', 'closed', 'close', 'passenger'),
+    'RRCY': ('doors', 'rear_passenger', 'closed', 'close', 'rear_passenger'),
+    'HDCY': ('other', 'hood', 'closed', 'close', 'hood'),
+    'LGCY': ('other', 'trunk', 'closed', 'close', 'trunk'),
+    'SRPOS': ('other', 'sunroof', 'closed', 'close', 'sunroof'),
+
+    'LSWD': ('doors', 'driver', 'locked', 'lock', 'driver'),
+    'LSWP': ('doors', 'passenger', 'locked', 'lock', 'passenger'),
+    'LSWR': ('doors', 'rear_passenger', 'locked', 'lock', 'rear_passenger'),
+    'LSWL': ('doors', 'rear_driver', 'locked', 'lock', 'rear_driver'),
+
+    # The other windows have always combined safety with the driver window
+    'PWDRD': ('windows', 'driver', 'closed', 'close', 'driver'),
+    'PWDRL': ('windows', 'rear_driver', 'closed', 'close', 'driver'),
+    'PWDRP': ('windows', 'passenger', 'closed', 'close', 'driver'),
+    'PWDRR': ('windows', 'rear_passenger', 'closed', 'close', 'driver'),
+}
+
+COMPONENT_NAMES = {
+    'doors': {
+        'driver': "Driver Door",
+        'passenger': "Passenger Door",
+        'rear_passenger': "Rear Passenger Door",
+        'rear_driver': "Rear Driver Door"
+    },
+    'windows': {
+        'driver': "Driver Window",
+        'passenger': "Passenger Window",
+        'rear_passenger': "Rear Passenger Window",
+        'rear_driver': "Rear Driver Window"
+    },
+    'other': {
+        'hood': "Hood",
+        'trunk': "Trunk",
+        'sunroof': "Sunroof"
+    }
+}
+
+
+# Fields of a row from StatusRowParser, in order. Dates are seconds
+# since the epoch; component flags are bitsets over COMPONENT_SLOTS.
+ROW_COLUMNS = ('ts', 'updated', 'odometer', 'fuel_gauge', 'drive_range', 'trip_a', 'trip_b',
+               'hazards_on', 'closed', 'closed_known', 'locked', 'locked_known', 'safe')
+
+_SLOT_BITS = {slot: 1 << i for i, slot in enumerate(m.COMPONENT_SLOTS)}
+_ALL_SLOTS = (1 << len(m.COMPONENT_SLOTS)) - 1
+
+# TYPE code -> (component bit, is a locked flag, DATA value meaning True,
+#               bit of the component whose safe flag is combined)
+COMPONENT_BITS = {
+    typ: (_SLOT_BITS[(group, key)], attr == 'locked', true_value, _SLOT_BITS[(group, safe_key)])
+    for typ, (group, key, attr, true_value, safe_key) in COMPONENTS.items()
+}
+MEASUREMENT_COLUMNS = {typ: ROW_COLUMNS.index(name) for typ, name in MEASUREMENTS.items()}
+
+NAN = float('nan')
+
+
+def _text(item, tag):
+    elem = item.find(tag)
+    if elem is not None:
+        return elem.text
+    return None
+
+
 class StatusParser(ResponseParser):
     """Return the status of the car"""
 
     def get_object(self):
-        date = dp.parse(self.root.find("DATETIME").text, tzinfos=tz)
-        dash = dp.parse(self.root.find("DASHBOARD_DATETIME").text, tzinfos=tz)
-
-        odometer = None
-        fuel_gague = None
-        drive_range = None
-        trip_a = None
-        trip_b = None
-        hazards_on = False
+        date = parse_timestamp(self.root.find("DATETIME").text)
+        dash = parse_timestamp(self.root.find("DASHBOARD_DATETIME").text)
 
-        doors = {
-            'driver': m.Component("Driver Door"),
-            'passenger': m.Component("Passenger Door"),
-            'rear_passenger': m.Component("Rear Passenger Door"),
-            'rear_driver': m.Component("Rear Driver Door")
-        }
-        windows = {
-            'driver': m.Component("Driver Window"),
-            'passenger': m.Component("Passenger Window"),
-            'rear_passenger': m.Component("Rear Passenger Window"),
-            'rear_driver': m.Component("Rear Driver Window")
-        }
-        other = {
-            'hood': m.Component("Hood"),
-            'trunk': m.Component("Trunk"),
-            'sunroof': m.Component("Sunroof")
+        measurements = dict.fromkeys(MEASUREMENTS.values())
+        hazards_on = False
+        groups = {
+            group: {key: m.Component(name) for key, name in names.items()}
+            for group, names in COMPONENT_NAMES.items()
         }
 
-        for item in self.root.findall('LIST/ITEM'):
-            typ = item.find('TYPE')
-            if typ is not None:
-                typ = typ.text
-            data = item.find('DATA')
-            if data is not None:
-                data = data.text
-            unit = item.find('UNIT')
-            if unit is not None:
-                unit = unit.text
-            safe = item.find('SECURITY')
-            if safe is not None:
-                safe = safe.text
-
-            if typ == 'ODO':
-                odometer = (float(data), unit)
-            elif typ == 'FUGAGE':
-                fuel_gague = (float(data), unit)
-            elif typ == 'RAGE':
-                drive_range = (float(data), unit)
-            elif typ == 'TRIPA':
-                trip_a = (float(data), unit)
-            elif typ == 'TRIPB':
-                trip_b = (float(data), unit)
-
-            elif typ == 'DCTY':
-                doors['driver'].closed = data == 'close'
-                doors['driver'].safe = doors['driver'].safe and (safe == 'safe')
-            elif typ == 'RLCY':
-                doors['rear_driver'].closed = data == 'close'
-                doors['rear_driver'].safe = doors['rear_driver'].safe and (safe == 'safe')
-            elif typ == 'PCTY':
-                doors['passenger'].closed = data == 'close'
-                doors['passenger'].safe = doors['passenger'].safe and (safe == 'safe')
-            elif typ == 'RRCY':
-                doors['rear_passenger'].closed = data == 'close'
-                doors['rear_passenger'].safe = doors['rear_passenger'].safe and (safe == 'safe')
-            elif typ == 'HDCY':
-                other['hood'].closed = data == 'close'
-                other['hood'].safe = other['hood'].safe and (safe == 'safe')
-            elif typ == 'LGCY':
-                other['trunk'].closed = data == 'close'
-                other['trunk'].safe = other['trunk'].safe and (safe == 'safe')
-            elif typ == 'SRPOS':
-                other['sunroof'].closed = data == 'close'
-                other['sunroof'].safe = other['sunroof'].safe and (safe == 'safe')
-
-            elif typ == 'LSWD':
-                doors['driver'].locked = data == 'lock'
-                doors['driver'].safe = doors['driver'].safe and (safe == 'safe')
-            elif typ == 'LSWP':
-                doors['passenger'].locked = data == 'lock'
-                doors['passenger'].safe = doors['passenger'].safe and (safe == 'safe')
-            elif typ == 'LSWR':
-                doors['rear_passenger'].locked = data == 'lock'
-                doors['rear_passenger'].safe = doors['rear_passenger'].safe and (safe == 'safe')
-            elif typ == 'LSWL':
-                doors['rear_driver'].locked = data == 'lock'
-                doors['rear_driver'].safe = doors['rear_driver'].safe and (safe == 'safe')
-
-            elif typ == 'PWDRD':
-                windows['driver'].closed = data == 'close'
-                windows['driver'].safe = windows['driver'].safe and (safe == 'safe')
-            elif typ == 'PWDRL':
-                windows['rear_driver'].closed = data == 'close'
-                windows['rear_driver'].safe = windows['driver'].safe and (safe == 'safe')
-            elif typ == 'PWDRP':
-                windows['passenger'].closed = data == 'close'
-                windows['passenger'].safe = windows['driver'].safe and (safe == 'safe')
-            elif typ == 'PWDRR':
-                windows['rear_passenger'].closed = data == 'close'
-                windows['rear_passenger'].safe = windows['driver'].safe and (safe == 'safe')
+        for item in self.root.iterfind('LIST/ITEM'):
+            typ = item.findtext('TYPE')
 
+            target = COMPONENTS.get(typ)
+            if target is not None:
+                group, key, attr, true_value, safe_key = target
+                comps = groups[group]
+                comp = comps[key]
+                setattr(comp, attr, item.findtext('DATA') == true_value)
+                comp.safe = comps[safe_key].safe and (item.findtext('SECURITY') == 'safe')
+            elif typ in MEASUREMENTS:
+                measurements[MEASUREMENTS[typ]] = (float(_text(item, 'DATA')), _text(item, 'UNIT'))
             elif typ == 'HAZB':
-                hazards_on = data != 'off'
+                hazards_on = item.findtext('DATA') != 'off'
 
         return m.VehicleStatus(
             date,
             dash,
-            odometer,
-            fuel_gague,
-            drive_range,
-            trip_a,
-            trip_b,
+            measurements['odometer'],
+            measurements['fuel_gauge'],
+            measurements['drive_range'],
+            measurements['trip_a'],
+            measurements['trip_b'],
             hazards_on,
-            doors,
-            windows,
-            other)
+            groups['doors'],
+            groups['windows'],
+            groups['other'])
+
+
+class StatusRowParser(ResponseParser):
+    '''
+    Return the status of the car as a (row, units) pair, where
+    row holds the ROW_COLUMNS values and units maps measurement
+    names to units. No Component objects are built.
+    '''
+
+    def get_object(self):
+        date = parse_timestamp(self.root.find("DATETIME").text)
+        dash = parse_timestamp(self.root.find("DASHBOARD_DATETIME").text)
+
+        row = [NAN] * len(ROW_COLUMNS)
+        row[0] = epoch_seconds(dash)
+        row[1] = epoch_seconds(date)
+        units = {}
+        hazards_on = 0
+        closed = closed_known = locked = locked_known = 0
+        safe = _ALL_SLOTS
+
+        for item in self.root.iterfind('LIST/ITEM'):
+            typ = item.findtext('TYPE')
+
+            target = COMPONENT_BITS.get(typ)
+            if target is not None:
+                bit, is_lock, true_value, safe_bit = target
+                value = item.findtext('DATA') == true_value
+                if is_lock:
+                    locked_known |= bit
+                    locked = locked | bit if value else locked & ~bit
+                else:
+                    closed_known |= bit
+                    closed = closed | bit if value else closed & ~bit
+                if safe & safe_bit and item.findtext('SECURITY') == 'safe':
+                    safe |= bit
+                else:
+                    safe &= ~bit
+            elif typ in MEASUREMENT_COLUMNS:
+                row[MEASUREMENT_COLUMNS[typ]] = float(_text(item, 'DATA'))
+                units[MEASUREMENTS[typ]] = _text(item, 'UNIT')
+            elif typ == 'HAZB':
+                hazards_on = 1 if item.findtext('DATA') != 'off' else 0
+
+        row[7:] = (hazards_on, closed, closed_known, locked, locked_known, safe)
+        return row, units
@@ -0,0 +1,162 @@
+"""Retrying failed commands and shedding load from unhealthy hosts"""
+import random
+import threading
+import time
+
+import requests
+
+from .models import ProgressResponse, ProgressStatus
+from . import AccountError
+
+
+class CircuitOpenError(AccountError):
+    """A request was refused because its host's circuit is open"""
+
+    def __init__(self, host: str, retry_after: float):
+        super().__init__("Too many failures from {}, retry in {:.1f}s".format(host, retry_after))
+        self.host = host
+        self.retry_after = retry_after
+
+
+class RetryPolicy:
+    '''
+    Decides whether a failed command is sent again, and how long
+    to wait first. Idempotent commands are retried on network
+    errors and the given HTTP statuses; other commands only when
+    the connection could not be made, so they were never sent.
+    Progress polls whose status is in progress_statuses, or
+    whose progress is in failed_codes, are polled again.
+    Backoff is exponential with full jitter.
+    '''
+    ATTEMPTS = 3
+    BASE_DELAY = 0.5
+    MAX_DELAY = 8
+    STATUSES = (500, 502, 503, 504)
+    ERRORS = (requests.ConnectionError, requests.Timeout)
+    UNSENT_ERRORS = (requests.exceptions.ConnectTimeout,)
+    PROGRESS_STATUSES = (ProgressStatus.UNKNOWN,)
+
+    def __init__(self, attempts: int = None, base_delay: float = None, max_delay: float = None,
+                 statuses=None, progress_statuses=None, failed_codes=()):
+        self.attempts = self.ATTEMPTS if attempts is None else attempts
+        self.base_delay = self.BASE_DELAY if base_delay is None else base_delay
+        self.max_delay = self.MAX_DELAY if max_delay is None else max_delay
+        self.statuses = frozenset(self.STATUSES if statuses is None else statuses)
+        self.progress_statuses = frozenset(
+            self.PROGRESS_STATUSES if progress_statuses is None else progress_statuses)
+        self.failed_codes = frozenset(failed_codes)
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait before the given retry, counting from 1"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def retry_error(self, command, error: Exception, attempt: int) -> bool:
+        """Whether to retry a command whose request raised"""
+        if attempt >= self.attempts:
+            return False
+        errors = self.ERRORS if command.idempotent else self.UNSENT_ERRORS
+        return isinstance(error, errors)
+
+    def retry_status(self, command, status: int, attempt: int) -> bool:
+        """Whether to retry a command answered with a non-200 status"""
+        return command.idempotent and attempt < self.attempts and status in self.statuses
+
+    def retry_result(self, command, result, attempt: int) -> bool:
+        '''
+        Whether to poll a progress response again. Only commands
+        of a polling loop are; a one-off read returns what it got.
+        '''
+        if (attempt >= self.attempts or not command.polling
+                or not isinstance(result, ProgressResponse)):
+            return False
+        return (result.command_status in self.progress_statuses or
+                (result.command_status == ProgressStatus.FAILED and
+                 result.progress in self.failed_codes))
+
+
+class CircuitBreaker:
+    '''
+    Refuses requests to a host after failure_threshold consecutive
+    failures. Once reset_timeout has passed a single trial request
+    is let through: success closes the circuit, failure reopens it.
+    A trial with no outcome after reset_timeout counts as lost, and
+    another one is let through.
+    '''
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, host: str, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.trial_at = 0
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """Raise CircuitOpenError unless a request may be sent now"""
+        if self.state == self.CLOSED:
+            return
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            now = time.monotonic()
+            if self.state == self.HALF_OPEN:
+                waited = now - self.trial_at
+            else:
+                waited = now - self.opened_at
+            if waited >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self.trial_at = now
+                return
+            raise CircuitOpenError(self.host, max(0, self.reset_timeout - waited))
+
+    def record(self, ok: bool):
+        """Record the outcome of a request that was let through"""
+        if ok and self.state == self.CLOSED and not self.failures:
+            return
+        with self._lock:
+            if ok:
+                self.failures = 0
+                self.state = self.CLOSED
+                return
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        '''
+        Give back a request that ended without telling anything
+        about the host, such as one cut off by a deadline. If it
+        was the trial, the next request becomes the trial.
+        '''
+        if self.state != self.HALF_OPEN:
+            return
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic() - self.reset_timeout
+
+
+class CircuitBreakers:
+    """One CircuitBreaker per host, created on first use"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, host: str) -> CircuitBreaker:
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            with self._lock:
+                breaker = self.breakers.get(host)
+                if breaker is None:
+                    breaker = CircuitBreaker(host, self.failure_threshold, self.reset_timeout)
+                    self.breakers[host] = breaker
+        return breaker
@@ -0,0 +1,197 @@
+"""Rate limiting and prioritising commands sent to the Enform service"""
+from collections import OrderedDict, deque
+import threading
+import time
+from typing import Dict, Tuple
+
+from . import deadline
+from .deadline import DeadlineExceeded
+
+
+class TokenBucket:
+    '''
+    Allows rate requests per second on average, with bursts of
+    up to burst requests. A rate of None never limits.
+    '''
+
+    def __init__(self, rate: float = None, burst: float = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available, 0 if one is now"""
+        if self.rate is None:
+            return 0
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        if self.rate is not None:
+            self.tokens -= 1
+
+
+class _Ticket:
+    __slots__ = ('key', 'vin', 'endpoint', 'priority', 'queued', 'granted')
+
+    def __init__(self, key, vin, endpoint, priority):
+        self.key = key
+        self.vin = vin
+        self.endpoint = endpoint
+        self.priority = priority
+        self.queued = time.monotonic()
+        self.granted = False
+
+
+class CommandScheduler:
+    '''
+    Decides when each command may be sent. Commands wait for a
+    token from the account's, the vehicle's and the endpoint's
+    bucket. Waiting commands are served by priority class, and
+    round-robin across vehicles within a class, so a burst for
+    one vehicle does not hold up the others. Progress polls
+    share the class of the command they are polling.
+    '''
+    # Highest priority first; anything else is a read
+    PRIORITIES = ('DL', 'RES', 'REALTIMESTATUSREQUEST', 'read')
+
+    # (requests per second, burst)
+    ACCOUNT_RATE = (5, 10)
+    VIN_RATE = (1, 4)
+    ENDPOINT_RATES = {
+        '/remote_control.aspx': (2, 4),
+    }
+
+    def __init__(self, account_rate: Tuple[float, float] = None,
+                 vin_rate: Tuple[float, float] = None,
+                 endpoint_rates: Dict[str, Tuple[float, float]] = None):
+        self.account_rate = account_rate or self.ACCOUNT_RATE
+        self.vin_rate = vin_rate or self.VIN_RATE
+        self.endpoint_rates = self.ENDPOINT_RATES if endpoint_rates is None else endpoint_rates
+        self._buckets = {}
+        self._queues = [OrderedDict() for _ in self.PRIORITIES]
+        self._depths = [0] * len(self.PRIORITIES)
+        self._cond = threading.Condition()
+
+        self.granted = [0] * len(self.PRIORITIES)
+        self.wait_seconds = [0.0] * len(self.PRIORITIES)
+
+    def priority(self, command) -> int:
+        """Index into PRIORITIES of a command's class"""
+        try:
+            return self.PRIORITIES.index(command.namespace)
+        except ValueError:
+            return len(self.PRIORITIES) - 1
+
+    def _bucket(self, kind, key):
+        bucket = self._buckets.get((kind, key))
+        if bucket is None:
+            if kind == 'account':
+                rate = self.account_rate
+            elif kind == 'vin':
+                rate = self.vin_rate
+            else:
+                rate = self.endpoint_rates.get(key, (None, 1))
+            bucket = self._buckets[(kind, key)] = TokenBucket(*rate)
+        return bucket
+
+    def _dispatch(self, now):
+        '''
+        Grant every ticket that can go now, in priority order.
+        Returns the seconds until another might be granted.
+        '''
+        granted = False
+        progress = True
+        while progress:
+            progress = False
+            soonest = None
+            for priority, queue in enumerate(self._queues):
+                for vin in list(queue):
+                    tickets = queue[vin]
+                    ticket = tickets[0]
+                    account = self._bucket('account', ticket.key)
+                    vehicle = self._bucket('vin', (ticket.key, vin))
+                    endpoint = self._bucket('endpoint', ticket.endpoint)
+                    wait = max(account.wait_time(now), vehicle.wait_time(now),
+                               endpoint.wait_time(now))
+                    if wait:
+                        soonest = wait if soonest is None else min(soonest, wait)
+                        continue
+                    account.take()
+                    vehicle.take()
+                    endpoint.take()
+                    ticket.granted = True
+                    progress = granted = True
+                    tickets.popleft()
+                    del queue[vin]
+                    if tickets:
+                        # back of the line for this vehicle's next command
+                        queue[vin] = tickets
+                    self._depths[priority] -= 1
+        if granted:
+            self._cond.notify_all()
+        return soonest
+
+    def acquire(self, command, key: str = None) -> float:
+        '''
+        Block until the command may be sent. key names the
+        account, for schedulers shared between accounts.
+        Returns the seconds spent waiting.
+        '''
+        ticket = _Ticket(key, command.vin, command.path, self.priority(command))
+        with self._cond:
+            queue = self._queues[ticket.priority]
+            if ticket.vin in queue:
+                queue[ticket.vin].append(ticket)
+            else:
+                queue[ticket.vin] = deque((ticket,))
+            self._depths[ticket.priority] += 1
+
+            limit = deadline.current()
+            try:
+                while True:
+                    wait = self._dispatch(time.monotonic())
+                    if ticket.granted:
+                        break
+                    if limit is None:
+                        self._cond.wait(wait)
+                    else:
+                        limit.wait(self._cond, wait, 'Waiting to send {}'.format(command.path))
+            except DeadlineExceeded:
+                if not ticket.granted:
+                    self._withdraw(ticket)
+                raise
+
+            waited = time.monotonic() - ticket.queued
+            self.granted[ticket.priority] += 1
+            self.wait_seconds[ticket.priority] += waited
+        return waited
+
+    def _withdraw(self, ticket):
+        queue = self._queues[ticket.priority]
+        tickets = queue[ticket.vin]
+        tickets.remove(ticket)
+        if not tickets:
+            del queue[ticket.vin]
+        self._depths[ticket.priority] -= 1
+        # the tickets behind it may be able to go now
+        self._cond.notify_all()
+
+    def depth(self, priority: int = None) -> int:
+        """Commands waiting in a priority class, or in all of them"""
+        if priority is None:
+            return sum(self._depths)
+        return self._depths[priority]
+
+    def stats(self) -> Dict[str, Dict]:
+        """Queue depth, commands sent and total wait, per priority class"""
+        with self._cond:
+            return {name: {
+                'queued': self._depths[i],
+                'granted': self.granted[i],
+                'wait_seconds': self.wait_seconds[i],
+            } for i, name in enumerate(self.PRIORITIES)}
@@ -0,0 +1,114 @@
+"""Status of a whole fleet, held as columns"""
+from array import array
+import math
+from typing import Dict, List
+
+from .history import TYPECODES
+from .models import COMPONENT_SLOTS
+from .response_parsers.status_parser import ROW_COLUMNS
+
+NAN = float('nan')
+
+
+class FleetSnapshot:
+    '''
+    One status per vehicle, stored as one array per ROW_COLUMNS
+    field: floats for dates and measurements, and bitsets over
+    COMPONENT_SLOTS for the closed, locked and safe flags. Vehicles
+    whose status could not be fetched have their error set and
+    NaN or zero in every column. Units are kept per vehicle, as a
+    fleet may report miles for some vehicles and kilometres for others.
+    '''
+
+    def __init__(self, vins: List[str]):
+        self.vins = list(vins)
+        count = len(self.vins)
+        self.columns = {}
+        for name in ROW_COLUMNS:
+            code = TYPECODES[name]
+            self.columns[name] = array(code, [NAN if code == 'd' else 0]) * count
+        self.errors = [None] * count
+        self.units = [{} for _ in range(count)]
+
+    def __len__(self):
+        return len(self.vins)
+
+    def __getitem__(self, name: str) -> array:
+        return self.columns[name]
+
+    def set_row(self, index: int, row, units: Dict[str, str] = None):
+        """Fill in the status of one vehicle from a StatusRowParser row"""
+        for name, value in zip(ROW_COLUMNS, row):
+            self.columns[name][index] = value
+        self.units[index] = dict(units or {})
+
+    def set_error(self, index: int, error: Exception):
+        """Record that the status of one vehicle could not be fetched"""
+        self.errors[index] = error
+
+    @property
+    def ok(self) -> List[int]:
+        """Indexes of the vehicles that have a status"""
+        return [i for i, err in enumerate(self.errors) if err is None]
+
+    def unit(self, index: int, name: str) -> str:
+        """Unit of a measurement for one vehicle, or None"""
+        return self.units[index].get(name)
+
+    def measurement_units(self, name: str) -> List[str]:
+        """Every unit a measurement is reported in across the fleet"""
+        return sorted({units[name] for units, value in zip(self.units, self.columns[name])
+                       if name in units and not math.isnan(value)})
+
+    def summary(self, name: str, unit: str = None) -> Dict[str, float]:
+        '''
+        count, sum, mean, min and max of a measurement, skipping
+        missing values. With unit, only vehicles reporting in it are
+        included; without, every vehicle must report the same unit.
+        '''
+        if unit is None:
+            found = self.measurement_units(name)
+            if len(found) > 1:
+                raise ValueError("{} is reported in {}; give a unit".format(
+                    name, ', '.join(found)))
+            unit = found[0] if found else None
+        values = [v for v, units in zip(self.columns[name], self.units)
+                  if not math.isnan(v) and units.get(name) == unit]
+        if not values:
+            return {'count': 0, 'sum': 0.0, 'mean': NAN, 'min': NAN, 'max': NAN,
+                    'unit': unit}
+        total = math.fsum(values)
+        return {'count': len(values), 'sum': total, 'mean': total / len(values),
+                'min': min(values), 'max': max(values), 'unit': unit}
+
+    @staticmethod
+    def bit(group: str, key: str) -> int:
+        """Mask of a component in the flag bitsets"""
+        return 1 << COMPONENT_SLOTS.index((group, key))
+
+    def open_mask(self) -> array:
+        """Per vehicle, the components reported open"""
+        return array('I', (known & ~closed for closed, known in zip(
+            self.columns['closed'], self.columns['closed_known'])))
+
+    def unlocked_mask(self) -> array:
+        """Per vehicle, the components reported unlocked"""
+        return array('I', (known & ~locked for locked, known in zip(
+            self.columns['locked'], self.columns['locked_known'])))
+
+    def count(self, mask: array, group: str, key: str) -> int:
+        """Number of vehicles with a component's bit set in a mask such as open_mask()"""
+        bit = self.bit(group, key)
+        return sum(1 for flags in mask if flags & bit)
+
+    def vins_where(self, mask: array, bits: int = None) -> List[str]:
+        """VINs with any of bits, or any bit at all, set in mask"""
+        if bits is None:
+            bits = (1 << len(COMPONENT_SLOTS)) - 1
+        return [vin for vin, flags in zip(self.vins, mask) if flags & bits]
+
+    def to_numpy(self) -> Dict:
+        """The columns as numpy arrays sharing this snapshot's memory"""
+        import numpy  # pylint: disable=C0415
+        return {name: numpy.frombuffer(col, dtype=col.typecode)
+                for name, col in self.columns.items()}
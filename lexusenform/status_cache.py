@@ -0,0 +1,106 @@
+"""Short-lived cache of vehicle statuses"""
+import threading
+import time
+from typing import Callable, Dict
+
+from .models import VehicleStatus
+
+
+class StatusCache:
+    '''
+    Per-vehicle status cache. Entries younger than ttl are served
+    as-is. Entries up to stale_ttl past that are still served, but
+    trigger a refresh in the background. Anything older is fetched
+    before returning. invalidate() bumps a per-vehicle generation,
+    so fetches that started before it do not store their result.
+    '''
+
+    def __init__(self, ttl: float = 30, stale_ttl: float = 300, background: bool = True):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.background = background
+        self._entries = {}
+        self._revalidating = set()
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.errors = 0
+
+    def get(self, vin: str, fetch: Callable[[], VehicleStatus]) -> VehicleStatus:
+        """Return the cached status for vin, calling fetch when needed"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(vin)
+            if entry is not None:
+                age = now - entry[0]
+                if age < self.ttl:
+                    self.hits += 1
+                    return entry[1]
+                if age < self.ttl + self.stale_ttl and self.background:
+                    self.stale_hits += 1
+                    if vin not in self._revalidating:
+                        self._revalidating.add(vin)
+                        threading.Thread(target=self._revalidate,
+                                         args=(vin, fetch, self._generations.get(vin, 0)),
+                                         daemon=True).start()
+                    return entry[1]
+            self.misses += 1
+            generation = self._generations.get(vin, 0)
+
+        status = fetch()
+        self.put(vin, status, generation)
+        return status
+
+    def _revalidate(self, vin, fetch, generation):
+        try:
+            if self.put(vin, fetch(), generation):
+                with self._lock:
+                    self.revalidations += 1
+        except Exception:  # pylint: disable=W0703
+            with self._lock:
+                self.errors += 1
+        finally:
+            with self._lock:
+                self._revalidating.discard(vin)
+
+    def put(self, vin: str, status: VehicleStatus, generation: int = None):
+        '''
+        Store a freshly fetched status. With the generation read
+        before fetching, it is dropped if vin was invalidated since.
+        Returns whether it was stored.
+        '''
+        with self._lock:
+            if generation is not None and generation != self._generations.get(vin, 0):
+                return False
+            old = self._entries.get(vin)
+            if (old is not None and old[1].dashboard_date == status.dashboard_date
+                    and old[1].last_updated_date == status.last_updated_date):
+                status = old[1]  # unchanged, keep the existing object
+            self._entries[vin] = (time.time(), status)
+            return True
+
+    def invalidate(self, vin: str):
+        """Drop the cached status for vin, e.g. after it was changed"""
+        with self._lock:
+            self._entries.pop(vin, None)
+            self._generations[vin] = self._generations.get(vin, 0) + 1
+
+    def clear(self):
+        """Drop every cached status"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Hit and miss counters"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'revalidations': self.revalidations,
+                'errors': self.errors,
+                'size': len(self._entries),
+            }
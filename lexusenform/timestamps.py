@@ -0,0 +1,49 @@
+"""Fast parsing of the timestamps returned by the Enform service"""
+from datetime import datetime, timezone
+from functools import lru_cache
+import re
+
+import dateutil.parser as dp
+from dateutil import tz as dtz
+
+from .timezone import TIMEZONE_MAPPING
+
+TZINFOS = {name: dtz.tzoffset(name, offset) for name, offset in TIMEZONE_MAPPING.items()}
+TZINFOS.update({'UTC': dtz.tzutc(), 'GMT': dtz.tzutc(), 'Z': dtz.tzutc()})
+
+_TIMESTAMP = re.compile(
+    r'(\d{4})[-/](\d{2})[-/](\d{2})[ T](\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,6}))?'
+    r'(?: ?([A-Z]{1,4}))?$')
+
+CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_timestamp(text: str) -> datetime:
+    '''
+    Parse a timestamp such as '2018-06-02 14:05:11 CDT'.
+    Anything not in a known format is handed to dateutil.
+    '''
+    match = _TIMESTAMP.match(text)
+    if match is not None:
+        year, month, day, hour, minute, second, frac, zone = match.groups()
+        tzinfo = None
+        if zone is not None:
+            tzinfo = TZINFOS.get(zone)
+        if zone is None or tzinfo is not None:
+            micro = int(frac.ljust(6, '0')) if frac else 0
+            return datetime(int(year), int(month), int(day), int(hour),
+                            int(minute), int(second), micro, tzinfo)
+    return dp.parse(text, tzinfos=TIMEZONE_MAPPING)
+
+
+def epoch_seconds(date: datetime) -> float:
+    '''
+    Seconds since the epoch, or NaN for None. Timestamps without a
+    zone are taken as UTC, not the host's local time.
+    '''
+    if date is None:
+        return float('nan')
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return date.timestamp()
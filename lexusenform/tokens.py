@@ -0,0 +1,115 @@
+"""Id token caching and refresh"""
+import threading
+import time
+
+from . import AccountError
+from . import deadline
+from . import jwt
+
+
+class TokenManager:
+    '''
+    Hands out the account's id token. The expiry is decoded once
+    per token, only one caller refreshes at a time while the rest
+    wait for its result, and the token is refreshed in the
+    background shortly before it expires.
+    '''
+    # Seconds before the expiry buffer at which the background refresh runs
+    REFRESH_AHEAD = 60
+
+    def __init__(self, account, background: bool = True):
+        self.account = account
+        self.background = background
+        self._token = None
+        self._expires = 0
+        self._cond = threading.Condition()
+        self._refreshing = False
+        self._error = None
+        self._timer = None
+
+    def _cached(self):
+        tok = self.account._token_cache.get(self.account.CACHE_ID_KEY)
+        if tok is None:
+            return None
+        if tok != self._token:
+            with self._cond:
+                if tok != self._token:
+                    self._expires = jwt.token_expiry(tok)
+                    self._token = tok
+                    self._schedule()
+        if time.time() > self._expires - self.account.EXPIRE_SECONDS_BUFFER:
+            return None
+        return tok
+
+    def get(self) -> str:
+        """Return a valid id token, refreshing it first if needed"""
+        tok = self._cached()
+        if tok is not None:
+            return tok
+        return self.refresh(force=False)
+
+    def refresh(self, force: bool = True) -> str:
+        '''
+        Refresh the id token. If a refresh is already running,
+        wait for it and share its result instead.
+        '''
+        with self._cond:
+            if self._refreshing:
+                limit = deadline.current()
+                while self._refreshing:
+                    if limit is None:
+                        self._cond.wait()
+                    else:
+                        limit.wait(self._cond, what='Token refresh')
+                if self._error is not None:
+                    # a separate error per waiter, so they do not share a traceback
+                    raise AccountError("Token refresh failed: {}".format(
+                        self._error)) from self._error
+                return self._token
+            if not force:
+                tok = self._cached()
+                if tok is not None:
+                    return tok
+            self._refreshing = True
+            self._error = None
+            seen = self.account._token_cache.get(self.account.CACHE_ID_KEY)
+
+        try:
+            self.account._renew_tokens(seen)
+        except Exception as ex:
+            with self._cond:
+                self._error = ex
+                self._refreshing = False
+                self._cond.notify_all()
+            raise
+
+        with self._cond:
+            self._refreshing = False
+            self._cond.notify_all()
+            self._cached()
+            return self._token
+
+    def _schedule(self):
+        if not self.background:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        delay = (self._expires - self.account.EXPIRE_SECONDS_BUFFER
+                 - self.REFRESH_AHEAD - time.time())
+        if delay <= 0:
+            return
+        self._timer = threading.Timer(delay, self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception:  # pylint: disable=W0703
+            pass  # the next foreground call will retry
+
+    def stop(self):
+        """Cancel any scheduled background refresh"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
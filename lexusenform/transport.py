@@ -0,0 +1,150 @@
+"""HTTP transports used by an Account"""
+from http.cookiejar import DefaultCookiePolicy
+import socket
+import threading
+from typing import Dict, Iterable
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class Transport:
+    """Base transport. Sends a single HTTP request and returns the response"""
+
+    def request(self, method: str, url: str, session: requests.Session = None, **kwargs):
+        """Implement in subclass"""
+        raise NotImplementedError()
+
+    def new_session(self) -> requests.Session:
+        '''
+        Create a session with its own cookie jar, used for
+        the multi-step login flow
+        '''
+        return requests.Session()
+
+    def get(self, url: str, **kwargs):
+        """Send a GET request"""
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        """Send a POST request"""
+        return self.request('POST', url, **kwargs)
+
+    def warm_up(self, urls: Iterable[str], timeout: float = 10):
+        """Open connections ahead of time. Returns hosts that failed"""
+        return []
+
+    def close(self):
+        """Release any held connections"""
+        pass
+
+
+class _NoCookies(DefaultCookiePolicy):
+    '''Refuses every cookie, so a shared session keeps no state between accounts'''
+
+    def set_ok(self, cookie, request):
+        return False
+
+
+class SessionTransport(Transport):
+    '''
+    Connection-pooled, keep-alive transport. A single instance
+    may be shared between many accounts: only connections are
+    shared, as its session never stores cookies. The login flow
+    gets a session of its own from new_session().
+    '''
+    POOL_CONNECTIONS = 10
+    POOL_MAXSIZE = 10
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, pool_connections: int = None, pool_maxsize: int = None,
+                 host_pool_sizes: Dict[str, int] = None, pool_block: bool = False):
+        self.pool_connections = pool_connections or self.POOL_CONNECTIONS
+        self.pool_maxsize = pool_maxsize or self.POOL_MAXSIZE
+        self.pool_block = pool_block
+
+        self.adapters = {}
+        self.session = requests.Session()
+        self.session.cookies.set_policy(_NoCookies())
+        self._mount_all(self.session)
+        for host, size in (host_pool_sizes or {}).items():
+            self.set_host_pool_size(host, size)
+
+    @classmethod
+    def shared(cls) -> 'SessionTransport':
+        """Process-wide transport, for accounts that want to share one pool"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def sibling(self) -> 'SessionTransport':
+        '''
+        A transport with a session of its own that shares this
+        one's connection pools, e.g. one per account
+        '''
+        other = type(self).__new__(type(self))
+        other.pool_connections = self.pool_connections
+        other.pool_maxsize = self.pool_maxsize
+        other.pool_block = self.pool_block
+        other.adapters = self.adapters
+        other.session = requests.Session()
+        other.session.cookies.set_policy(_NoCookies())
+        self._mount_all(other.session)
+        return other
+
+    def _mount_all(self, session):
+        if not self.adapters:
+            default = HTTPAdapter(pool_connections=self.pool_connections,
+                                  pool_maxsize=self.pool_maxsize,
+                                  pool_block=self.pool_block)
+            self.adapters['https://'] = default
+            self.adapters['http://'] = default
+        for prefix, adapter in self.adapters.items():
+            session.mount(prefix, adapter)
+
+    def set_host_pool_size(self, host: str, size: int):
+        '''
+        Give a host its own connection pool with the given size.
+        The host may include a scheme, otherwise https is assumed.
+        '''
+        prefix = host if '://' in host else 'https://' + host
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size,
+                              pool_block=self.pool_block)
+        self.adapters[prefix] = adapter
+        self.session.mount(prefix, adapter)
+
+    def new_session(self) -> requests.Session:
+        sess = requests.Session()
+        self._mount_all(sess)
+        return sess
+
+    def request(self, method: str, url: str, session: requests.Session = None, **kwargs):
+        return (session or self.session).request(method, url, **kwargs)
+
+    def warm_up(self, urls: Iterable[str], timeout: float = 10):
+        '''
+        Resolve DNS and open a TLS connection to each url's host
+        so the first real request does not pay for the handshake.
+        Returns the list of hosts that could not be reached.
+        '''
+        failed = []
+        seen = set()
+        for url in urls:
+            parts = urlsplit(url)
+            origin = '{}://{}'.format(parts.scheme, parts.netloc)
+            if origin in seen:
+                continue
+            seen.add(origin)
+            try:
+                socket.getaddrinfo(parts.hostname, parts.port or 443)
+                self.session.head(origin, timeout=timeout, allow_redirects=False)
+            except (OSError, requests.RequestException):
+                failed.append(parts.netloc)
+        return failed
+
+    def close(self):
+        self.session.close()
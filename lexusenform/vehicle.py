@@ -2,10 +2,45 @@
 from datetime import timedelta
 import json
 import time
+from typing import Iterator
 
 from .commands import Commands as c
-from .models import ProgressStatus
+from .models import PlanResult, ProgressStatus
+from .polling import FixedPolling, ProgressTracker
+from .watch import Change, WatchCadence, diff_status
 from . import AccountError
+from . import deadline
+
+
+def progress_finished(prog, vehicle_code: str = None) -> bool:
+    '''
+    Check whether a command has finished, optionally waiting
+    for a specific vehicle code. Raises if the command failed.
+    '''
+    if (prog.command_status == ProgressStatus.COMPLETED and
+            (vehicle_code is None or
+             prog.vehicle_code == vehicle_code)):
+        return True
+    if (prog.command_status == ProgressStatus.FAILED or
+            prog.command_status == ProgressStatus.UNKNOWN):
+        if prog.progress is not None:
+            raise AccountError(
+                "Processing of command failed with value {}".format(prog.progress))
+        elif prog.response_text is not None:
+            raise AccountError("Processing of command failed:\n{}".format(prog.response_text))
+        else:
+            raise AccountError("Processing of command failed with code {}".format(prog.code))
+    return False
+
+
+def print_progress(prog):
+    '''Print command progress, for debugging'''
+    if prog.progress is not None or prog.response_text is None:
+        print("Progress: {}".format(prog.progress))
+    else:
+        print("Progress:\n{}".format(prog.response_text))
+    if prog.vehicle_code is not None:
+        print("Vehicle code: {}".format(prog.vehicle_code))
 
 
 class Vehicle:
@@ -38,37 +73,37 @@ class Vehicle:
     def __process_until_finished(self,
                                  namespace: str,
                                  vehicle_code: str = None,
-                                 sleep: timedelta = timedelta(seconds=5),
-                                 timeout: timedelta = timedelta(minutes=3)):
-        '''Check progress on command until it's finished. Optionally, wait for vehicle code'''
-        tok = self._account.get_id_token()
-        prog_c = c.command_progress(tok, self.full_vin, namespace)
+                                 sleep: timedelta = None,
+                                 timeout: timedelta = timedelta(minutes=3),
+                                 tok: str = None):
+        '''
+        Check progress on command until it's finished. Optionally, wait
+        for vehicle code. Gives up after timeout, or sooner if the
+        current deadline ends or is cancelled.
+        '''
+        if tok is None:
+            tok = self._account.get_id_token()
+        if sleep is None and self._account.poller is not None:
+            return self._account.poller.wait(self.full_vin, namespace, tok,
+                                             vehicle_code, timeout.total_seconds())
+
+        prog_c = c.command_progress(tok, self.full_vin, namespace, polling=True)
         expires = time.time() + timeout.total_seconds()
+        what = 'Command {}'.format(namespace)
+        strategy = self._account.polling if sleep is None else FixedPolling(sleep.total_seconds())
+        tracker = ProgressTracker(strategy, namespace, self._account.instrumentation)
 
         prog = None
         while True:
             prog = self._account.execute(prog_c)
-            if (prog.command_status == ProgressStatus.COMPLETED and
-                    (vehicle_code is None or
-                     prog.vehicle_code == vehicle_code)):
+            if progress_finished(prog, vehicle_code):
+                tracker.finish(prog)
                 break
-            if (prog.command_status == ProgressStatus.FAILED or
-                    prog.command_status == ProgressStatus.UNKNOWN):
-                if prog.progress is not None:
-                    raise AccountError(
-                        "Processing of command failed with value {}".format(prog.progress))
-                else:
-                    raise AccountError("Processing of command failed:\n{}".format(prog.response_text))
             if time.time() > expires:
                 raise AccountError("Command timed out without completing")
             if self._account.DEBUG:
-                if prog.progress is not None:
-                    print("Progress: {}".format(prog.progress))
-                else:
-                    print("Progress:\n{}".format(prog.response_text))
-                if prog.vehicle_code is not None:
-                    print("Vehicle code: {}".format(prog.vehicle_code))
-            time.sleep(sleep.total_seconds())
+                print_progress(prog)
+            deadline.sleep(tracker.update(prog), what)
         return prog
 
 
@@ -79,15 +114,63 @@ class Vehicle:
         as odometer and fuel readings.
         '''
         self.ensure_vin()
-        tok = self._account.get_id_token()
+        cache = self._account.status_cache
 
         if force_refresh:
+            tok = self._account.get_id_token()
             cmd = c.begin_refresh_vehicle_status(tok, self.full_vin)
             self._account.execute(cmd)
             self.__process_until_finished(cmd.namespace)
+        elif cache is not None:
+            return cache.get(self.full_vin, self._fetch_status)
+
+        status = self._fetch_status()
+        if cache is not None:
+            cache.put(self.full_vin, status)
+        return status
 
+    def _fetch_status(self, tok: str = None):
+        if tok is None:
+            tok = self._account.get_id_token()
         cmd = c.vehicle_status(tok, self.full_vin)
-        return self._account.execute(cmd)
+        status = self._account.execute(cmd)
+        if self._account.history is not None:
+            self._account.history.append(self.full_vin, status)
+        return status
+
+    def _watch_poll(self, refresh):
+        if refresh:
+            return self.status(force_refresh=True)
+        status = self._fetch_status()
+        if self._account.status_cache is not None:
+            self._account.status_cache.put(self.full_vin, status)
+        return status
+
+    def watch(self, min_interval: float = None, max_interval: float = None,
+              refresh: bool = False) -> Iterator[Change]:
+        '''
+        Poll the status and yield a Change for every difference
+        from the previous poll. Polls come every min_interval seconds
+        while things change and back off towards max_interval while
+        the vehicle is idle. With refresh, each poll first asks the
+        vehicle for a fresh status, which is much slower.
+        '''
+        self.ensure_vin()
+        cadence = WatchCadence(min_interval, max_interval)
+        last = self._watch_poll(refresh)
+        interval = cadence.interval
+        while True:
+            deadline.sleep(interval, 'Watch')
+            status = self._watch_poll(refresh)
+            changes = diff_status(last, status, self.full_vin)
+            last = status
+            for change in changes:
+                yield change
+            interval = cadence.next(bool(changes))
+
+    def _invalidate_status(self):
+        if self._account.status_cache is not None:
+            self._account.status_cache.invalidate(self.full_vin)
 
 
     def get_location(self, force_refresh=False):
@@ -104,21 +187,62 @@ class Vehicle:
         if force_refresh:
             cmd = c.begin_refresh_vehicle_status(tok, self.full_vin)
             self._account.execute(cmd)
-            return self.__process_until_finished(cmd.namespace).location
+            prog = self.__process_until_finished(cmd.namespace)
+            # the vehicle has reported a new status
+            self._invalidate_status()
+            return prog.location
             
         prog_c = c.command_progress(tok, self.full_vin, namespace)
         prog = self._account.execute(prog_c)
         return prog.location
 
+    def run_plan(self, refresh: bool = False, status: bool = True,
+                 location: bool = False) -> PlanResult:
+        '''
+        Read the status and/or location in as few requests as
+        possible, with one id token for the whole plan. With refresh,
+        the vehicle is woken once: the final progress of that refresh
+        gives the location and one status read follows it.
+        '''
+        self.ensure_vin()
+        tok = self._account.get_id_token()
+        cache = self._account.status_cache
+        result = PlanResult(refreshed=refresh)
+
+        if refresh:
+            cmd = c.begin_refresh_vehicle_status(tok, self.full_vin)
+            self._account.execute(cmd)
+            prog = self.__process_until_finished(cmd.namespace, tok=tok)
+            if location:
+                result.location = prog.location
+            if status:
+                result.status = self._fetch_status(tok)
+                if cache is not None:
+                    cache.put(self.full_vin, result.status)
+            return result
+
+        if status:
+            if cache is not None:
+                result.status = cache.get(self.full_vin, lambda: self._fetch_status(tok))
+            else:
+                result.status = self._fetch_status(tok)
+        if location:
+            prog = self._account.execute(c.command_progress(tok, self.full_vin, 'RES'))
+            result.location = prog.location
+        return result
+
 
     def lock_doors(self):
         '''Lock the car's doors'''
         self.ensure_vin()
         tok = self._account.get_id_token()
         cmd = c.begin_lock_door(tok, self.full_vin)
-        self._account.execute(cmd)
-
-        self.__process_until_finished(cmd.namespace, vehicle_code='01')
+        try:
+            self._account.execute(cmd)
+            self.__process_until_finished(cmd.namespace, vehicle_code='01')
+        finally:
+            # even a failed command may have reached the vehicle
+            self._invalidate_status()
         # Code of D9 means doors already locked??
 
         return True
@@ -129,9 +253,11 @@ class Vehicle:
         self.ensure_vin()
         tok = self._account.get_id_token()
         cmd = c.begin_unlock_door(tok, self.full_vin)
-        self._account.execute(cmd)
-
-        self.__process_until_finished(cmd.namespace, vehicle_code='01')
+        try:
+            self._account.execute(cmd)
+            self.__process_until_finished(cmd.namespace, vehicle_code='01')
+        finally:
+            self._invalidate_status()
 
         return True
 
@@ -141,9 +267,11 @@ class Vehicle:
         self.ensure_vin()
         tok = self._account.get_id_token()
         cmd = c.begin_remote_start(tok, self.full_vin)
-        self._account.execute(cmd)
-
-        self.__process_until_finished(cmd.namespace, vehicle_code='01')
+        try:
+            self._account.execute(cmd)
+            self.__process_until_finished(cmd.namespace, vehicle_code='01')
+        finally:
+            self._invalidate_status()
 
         return True
 
@@ -153,9 +281,11 @@ class Vehicle:
         self.ensure_vin()
         tok = self._account.get_id_token()
         cmd = c.begin_remote_stop(tok, self.full_vin)
-        self._account.execute(cmd)
-
-        self.__process_until_finished(cmd.namespace, vehicle_code='01')
+        try:
+            self._account.execute(cmd)
+            self.__process_until_finished(cmd.namespace, vehicle_code='01')
+        finally:
+            self._invalidate_status()
 
         return True
 
@@ -0,0 +1,120 @@
+"""Change events computed from successive vehicle statuses"""
+from typing import List
+
+from .history import MEASUREMENTS, pack_components
+from .models import COMPONENT_SLOTS, VehicleStatus
+
+
+class Change:
+    '''One difference between two successive statuses of a vehicle'''
+    __slots__ = ('vin', 'field', 'old', 'new', 'timestamp')
+
+    def __init__(self, field: str, old, new, vin: str = None, timestamp=None):
+        self.field = field
+        self.old = old
+        self.new = new
+        self.vin = vin
+        self.timestamp = timestamp
+
+    def __repr__(self):
+        return '<{} {}: {!r} -> {!r}>'.format(type(self).__name__, self.field, self.old, self.new)
+
+
+class MeasurementChange(Change):
+    '''odometer, fuel_gauge, drive_range, trip_a or trip_b changed. Values are (value, unit)'''
+    __slots__ = ()
+
+
+class HazardsChange(Change):
+    '''The hazard lights were turned on or off'''
+    __slots__ = ()
+
+
+class ComponentChange(Change):
+    '''
+    The closed, locked or safe flag of a door, window, the hood,
+    trunk or sunroof changed. closed and locked may be None when
+    the vehicle did not report them.
+    '''
+    __slots__ = ('group', 'key', 'name', 'attr')
+
+    def __init__(self, group: str, key: str, name: str, attr: str, old, new,
+                 vin: str = None, timestamp=None):
+        super().__init__('{}.{}.{}'.format(group, key, attr), old, new, vin, timestamp)
+        self.group = group
+        self.key = key
+        self.name = name
+        self.attr = attr
+
+
+def _flag(bits, known, mask):
+    if not known & mask:
+        return None
+    return bool(bits & mask)
+
+
+def diff_status(old: VehicleStatus, new: VehicleStatus, vin: str = None) -> List[Change]:
+    '''
+    Every change from old to new. Component flags are compared as
+    bitsets first, so unchanged components cost nothing.
+    '''
+    stamp = new.dashboard_date
+    changes = []
+    for name in MEASUREMENTS:
+        before, after = getattr(old, name), getattr(new, name)
+        if before != after:
+            changes.append(MeasurementChange(name, before, after, vin, stamp))
+    if old.hazards_on != new.hazards_on:
+        changes.append(HazardsChange('hazards_on', old.hazards_on, new.hazards_on, vin, stamp))
+
+    before, after = pack_components(old), pack_components(new)
+    if before == after:
+        return changes
+    closed, closed_known, locked, locked_known, safe = before
+    closed2, closed_known2, locked2, locked_known2, safe2 = after
+    closed_diff = (closed ^ closed2) | (closed_known ^ closed_known2)
+    locked_diff = (locked ^ locked2) | (locked_known ^ locked_known2)
+    safe_diff = safe ^ safe2
+    for bit, (group, key) in enumerate(COMPONENT_SLOTS):
+        mask = 1 << bit
+        if not (closed_diff | locked_diff | safe_diff) & mask:
+            continue
+        name = getattr(new, group)[key].name
+        if closed_diff & mask:
+            changes.append(ComponentChange(
+                group, key, name, 'closed', _flag(closed, closed_known, mask),
+                _flag(closed2, closed_known2, mask), vin, stamp))
+        if locked_diff & mask:
+            changes.append(ComponentChange(
+                group, key, name, 'locked', _flag(locked, locked_known, mask),
+                _flag(locked2, locked_known2, mask), vin, stamp))
+        if safe_diff & mask:
+            changes.append(ComponentChange(
+                group, key, name, 'safe', bool(safe & mask), bool(safe2 & mask), vin, stamp))
+    return changes
+
+
+class WatchCadence:
+    '''
+    Interval between status polls while watching a vehicle. It
+    drops to min_interval whenever something changed and grows by
+    BACKOFF after every poll where nothing did, up to max_interval.
+    '''
+    MIN_INTERVAL = 60
+    MAX_INTERVAL = 900
+    BACKOFF = 2
+
+    def __init__(self, min_interval: float = None, max_interval: float = None,
+                 backoff: float = None):
+        self.min_interval = min_interval or self.MIN_INTERVAL
+        self.max_interval = max(max_interval or self.MAX_INTERVAL, self.min_interval)
+        self.backoff = backoff or self.BACKOFF
+        self.interval = self.min_interval
+
+    def next(self, changed: bool) -> float:
+        """Seconds until the next poll, given whether the last one saw changes"""
+        if changed:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * self.backoff)
+        return self.interval